@@ -0,0 +1,98 @@
+"""Benchmark del generador de calendario.
+
+Uso:
+    python benchmarks/bench_calendar.py [participantes] [años]
+
+Compara generate_calendar() con el ciclo fila por fila que usaba
+"Generar / Reemplazar calendario" (solo para un año; a 10k x 20 el ciclo
+tarda demasiado y se extrapola).
+"""
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tanda_calendar import generate_calendar  # noqa: E402
+
+
+def make_participants(n, seed=0):
+    rng = np.random.default_rng(seed)
+    inicio = np.datetime64("1925-01-01")
+    dias = rng.integers(0, 365 * 80, size=n)
+    fechas = pd.Series(inicio + dias).dt.strftime("%Y-%m-%d")
+    # Algunos 29 de febrero para ejercitar el ajuste de bisiestos.
+    fechas.iloc[:: max(n // 50, 1)] = "1992-02-29"
+    return pd.DataFrame(
+        {
+            "id": np.arange(1, n + 1),
+            "nombre": [f"Participante {i}" for i in range(1, n + 1)],
+            "fecha_cumple": fechas,
+        }
+    )
+
+
+def legacy_calendar(dfp, yr, aporte, max_id=0):
+    rows = []
+    total_recibir = aporte * max(len(dfp) - 1, 0)
+    for _, row in dfp.iterrows():
+        try:
+            fcx = datetime.strptime(str(row["fecha_cumple"]), "%Y-%m-%d")
+        except Exception:
+            fcx = pd.to_datetime(str(row["fecha_cumple"]), errors="coerce")
+        if pd.isna(fcx):
+            continue
+        try:
+            fpay = fcx.replace(year=int(yr))
+        except ValueError:
+            if fcx.month == 2 and fcx.day == 29:
+                fpay = datetime(int(yr), 2, 28)
+            else:
+                continue
+        max_id += 1
+        rows.append(
+            {
+                "id": max_id,
+                "anio": int(yr),
+                "id_participante": int(row["id"]),
+                "fecha_pago": fpay.strftime("%Y-%m-%d"),
+                "total_a_recibir": float(total_recibir),
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+def timed(fn, *args, **kwargs):
+    inicio = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - inicio
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    n_years = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    years = list(range(2025, 2025 + n_years))
+    dfp = make_participants(n)
+
+    # Mismo resultado que el ciclo anterior (muestra pequeña).
+    sample = dfp.head(500)
+    esperado = legacy_calendar(sample, 2027, 50.0)
+    obtenido = generate_calendar(sample, [2027], 50.0)
+    assert esperado["fecha_pago"].tolist() == obtenido["fecha_pago"].dt.strftime("%Y-%m-%d").tolist()
+    assert esperado["id"].tolist() == obtenido["id"].tolist()
+
+    df, t_vec = timed(generate_calendar, dfp, years, 50.0)
+    _, t_loop = timed(legacy_calendar, dfp, years[0], 50.0)
+
+    print(f"participantes={n} años={n_years} filas={len(df)}")
+    print(f"generate_calendar (todos los años): {t_vec * 1000:10.1f} ms")
+    print(f"ciclo anterior (1 año):             {t_loop * 1000:10.1f} ms")
+    print(f"ciclo anterior ({n_years} años, estimado): {t_loop * n_years * 1000:10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Benchmark de la capa de datos sobre una hoja falsa en memoria (sin red).
+
+Uso:
+    python benchmarks/bench_storage.py [--participantes 10,100,1000,10000]
+                                       [--anios 1,10,50] [--latencia 0.0]
+
+Para cada combinación de participantes y años llena un FakeSpreadsheet
+(calendario particionado por año) y mide, con SheetsStorage:
+
+    load_participants, load_calendar (todos / un año), add_participant,
+    generate_calendar, allocate_ids, save_calendar_for_year (reemplazar el
+    último año), editar una celda y guardar la matriz de pagos de hasta 31
+    turnos.
+
+Reporta el tiempo y las llamadas a la API de cada operación. `--latencia`
+simula los segundos por llamada (p. ej. 0.2 para acercarse a Sheets real);
+con 0 solo se mide el trabajo local.
+"""
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_calendar import make_participants  # noqa: E402
+from fake_sheets import FakeSpreadsheet  # noqa: E402
+from tanda_calendar import generate_calendar  # noqa: E402
+from tanda_storage import (  # noqa: E402
+    CALENDAR_INDEX,
+    COLS_CALENDARIO,
+    COLS_INDICE,
+    COLS_PAGOS,
+    COLS_PARTICIPANTES,
+    SheetsStorage,
+    ensure_columns,
+    frame_values,
+    partition_title,
+)
+
+
+def _fill(ss, title, df, columns):
+    ws = ss._add(title)
+    df = ensure_columns(df.copy(), columns)
+    ws.data = [list(columns)] + frame_values(df).values.tolist()
+    return ws
+
+
+def seed_spreadsheet(n, n_years, latency):
+    # Escribe directo en las hojas falsas (sin contar llamadas).
+    ss = FakeSpreadsheet(latency=latency)
+    dfp = make_participants(n)
+    dfp["telefono"] = ""
+    dfp["email"] = ""
+    dfp["notas"] = ""
+    _fill(ss, "participantes", dfp, COLS_PARTICIPANTES)
+
+    years = list(range(2025, 2025 + n_years))
+    df = generate_calendar(dfp, years, 50.0)
+    indice = []
+    for anio, df_y in df.groupby("anio"):
+        _fill(ss, partition_title(anio), df_y, COLS_CALENDARIO)
+        indice.append((anio, partition_title(anio), int(df_y["id"].max())))
+    _fill(ss, CALENDAR_INDEX, pd.DataFrame(indice, columns=COLS_INDICE), COLS_INDICE)
+    _fill(ss, "pagos", pd.DataFrame(columns=COLS_PAGOS), COLS_PAGOS)
+    return ss, dfp, years
+
+
+def measure(ss, fn, *args, **kwargs):
+    antes = Counter(ss.calls)
+    inicio = time.perf_counter()
+    result = fn(*args, **kwargs)
+    ms = (time.perf_counter() - inicio) * 1000
+    llamadas = Counter(ss.calls)
+    llamadas.subtract(antes)
+    return result, ms, sum(llamadas.values()), dict(+llamadas)
+
+
+def run_case(n, n_years, latency):
+    ss, dfp, years = seed_spreadsheet(n, n_years, latency)
+    storage = SheetsStorage(ss)
+    # Como al abrir el admin: los contadores de ids ya existen.
+    storage.rebuild_sequences()
+    ultimo = years[-1]
+    rows = []
+
+    def op(nombre, fn, *args, **kwargs):
+        result, ms, total, detalle = measure(ss, fn, *args, **kwargs)
+        rows.append(
+            {
+                "participantes": n,
+                "años": n_years,
+                "operación": nombre,
+                "ms": round(ms, 1),
+                "llamadas": total,
+                "detalle": " ".join(f"{k}={v}" for k, v in sorted(detalle.items())),
+            }
+        )
+        return result
+
+    participants = op("load_participants", storage.load_participants)
+    op("load_calendar (todos)", storage.load_calendar)
+    op("load_calendar (1 año)", storage.load_calendar, ultimo)
+
+    op("add_participant", storage.add_participant, "Nuevo", "2000-01-01", "", "", "")
+    df_new = op("generate_calendar (1 año)", generate_calendar, participants, [ultimo], 60.0)
+    primero = op("allocate_ids (calendario)", storage.allocate_ids, "calendario", len(df_new))
+    df_new["id"] += primero - 1
+    op("save_calendar_for_year", storage.replace_calendar_year, df_new, ultimo)
+
+    df_old = storage.load_calendar(ultimo)
+    df_edit = df_old.copy()
+    df_edit["notas"] = df_edit["notas"].astype(object)
+    df_edit.loc[df_edit.index[0], "notas"] = "editado"
+    op("editar una celda", storage.write_calendar, df_old, df_edit)
+
+    # Matriz de pagos: hasta 31 turnos con todos los aportes, en un guardado.
+    turnos = df_old["id"].head(31).tolist()
+    marcar = [(int(c), int(p)) for c in turnos for p in participants["id"]]
+    op(
+        "guardar control de pagos",
+        storage.save_payment_changes,
+        marcar, (), turnos, ultimo,
+    )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--participantes", default="10,100,1000,10000")
+    parser.add_argument("--anios", default="1,10,50")
+    parser.add_argument("--latencia", type=float, default=0.0)
+    args = parser.parse_args()
+
+    rows = []
+    for n in [int(x) for x in args.participantes.split(",")]:
+        for n_years in [int(x) for x in args.anios.split(",")]:
+            rows += run_case(n, n_years, args.latencia)
+
+    pd.set_option("display.width", 200)
+    pd.set_option("display.max_colwidth", 90)
+    print(pd.DataFrame(rows).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Sustituto en memoria de gspread.Spreadsheet / Worksheet para benchmarks.
+
+Implementa solo las llamadas de SheetsStorage que hacen los benchmarks.
+`latency` son los segundos simulados por llamada a la API y `calls` cuenta
+las llamadas por tipo, para medir cuántas hace cada operación sin red.
+"""
+import re
+import time
+from collections import Counter
+
+from gspread.utils import a1_range_to_grid_range
+
+
+def _user_entered(v):
+    # Lo mismo que hace Sheets con USER_ENTERED para lo que usa la app:
+    # números como números, todo lo demás como texto.
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        return v
+    s = "" if v is None else str(v)
+    if re.fullmatch(r"-?\d+", s):
+        return int(s)
+    if re.fullmatch(r"-?\d+\.\d*", s):
+        return float(s)
+    return s
+
+
+class FakeWorksheet:
+
+    def __init__(self, spreadsheet, title, sheet_id, rows=1000, cols=26):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = sheet_id
+        self.row_count = rows
+        self.col_count = cols
+        self.data = []
+
+    def _call(self, name):
+        self.spreadsheet._call(name)
+
+    # ---------------- helpers ----------------
+
+    def _ensure(self, row, col):
+        while len(self.data) < row:
+            self.data.append([])
+        r = self.data[row - 1]
+        while len(r) < col:
+            r.append("")
+        self.row_count = max(self.row_count, row)
+        self.col_count = max(self.col_count, col)
+
+    def _set(self, row, col, value):
+        self._ensure(row, col)
+        self.data[row - 1][col - 1] = _user_entered(value)
+
+    def _last_row(self):
+        n = len(self.data)
+        while n and not any(v != "" for v in self.data[n - 1]):
+            n -= 1
+        return n
+
+    def values(self):
+        out = [list(r) for r in self.data[: self._last_row()]]
+        for r in out:
+            while r and r[-1] == "":
+                r.pop()
+        return out
+
+    # ---------------- API gspread ----------------
+
+    def append_row(self, values, value_input_option="RAW", **kwargs):
+        self._call("append_row")
+        row = self._last_row() + 1
+        for j, v in enumerate(values, start=1):
+            self._set(row, j, v)
+
+    def append_rows(self, values, value_input_option="RAW", **kwargs):
+        self._call("append_rows")
+        del self.data[self._last_row():]
+        self.data.extend([_user_entered(v) for v in vals] for vals in values)
+        self.row_count = max(self.row_count, len(self.data))
+
+    def batch_update(self, data, **kwargs):
+        self._call("values_batch_update")
+        for item in data:
+            grid = a1_range_to_grid_range(item["range"])
+            r0 = grid.get("startRowIndex", 0) + 1
+            c0 = grid.get("startColumnIndex", 0) + 1
+            for i, vals in enumerate(item["values"]):
+                for j, v in enumerate(vals):
+                    self._set(r0 + i, c0 + j, v)
+
+
+class FakeSpreadsheet:
+    # Sustituto en memoria de gspread.Spreadsheet. `latency` son los
+    # segundos simulados por llamada a la API; `calls` cuenta las llamadas.
+
+    def __init__(self, title="TandaDB", latency=0.0):
+        self.title = title
+        self.id = title
+        self.latency = latency
+        self.calls = Counter()
+        self._sheets = {}
+        self._next_id = 1
+
+    def _call(self, name):
+        self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _add(self, title, rows=1000, cols=26):
+        ws = FakeWorksheet(self, title, self._next_id, rows, cols)
+        self._next_id += 1
+        self._sheets[title] = ws
+        return ws
+
+    def worksheets(self, exclude_hidden=False):
+        self._call("fetch_sheet_metadata")
+        return list(self._sheets.values())
+
+    def add_worksheet(self, title, rows, cols, index=None):
+        self._call("batch_update")
+        return self._add(title, rows, cols)
+
+    def _range_values(self, rng):
+        title, _, cells = rng.partition("!")
+        title = title.strip("'").replace("''", "'")
+        ws = self._sheets.get(title)
+        if ws is None:
+            return []
+        values = ws.values()
+        if cells:
+            grid = a1_range_to_grid_range(cells)
+            r0 = grid.get("startRowIndex", 0)
+            r1 = grid.get("endRowIndex", len(values))
+            c0 = grid.get("startColumnIndex", 0)
+            c1 = grid.get("endColumnIndex", None)
+            values = [r[c0:c1] for r in values[r0:r1]]
+        return values
+
+    def values_get(self, range, params=None):
+        self._call("values_get")
+        return {"range": range, "values": self._range_values(range)}
+
+    def values_batch_get(self, ranges, params=None):
+        self._call("values_batch_get")
+        return {
+            "valueRanges": [
+                {"range": r, "values": self._range_values(r)} for r in ranges
+            ]
+        }
+
+    def batch_update(self, body):
+        self._call("batch_update")
+        by_id = {ws.id: ws for ws in self._sheets.values()}
+        for req in body.get("requests", []):
+            if "deleteDimension" in req:
+                rng = req["deleteDimension"]["range"]
+                ws = by_id[rng["sheetId"]]
+                del ws.data[rng["startIndex"] : rng["endIndex"]]
+        return {}
@@ -2,9 +2,26 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime, date
 
-from google.oauth2.service_account import Credentials
-import gspread
-from gspread_dataframe import get_as_dataframe, set_with_dataframe
+from tanda_storage import CAMPOS_EDITABLES, calendar_year, merge_calendar_edits
+from tanda_calendar import generate_calendar
+from tanda_payments import PaymentMatrix
+from tanda_import import read_participants_file, validate_participants
+from tanda_queue import WriteBehindStorage
+from tanda_metrics import start_rerun, section, stage, finish_rerun
+from tanda_db import (
+    current_tanda,
+    tandas,
+    overview,
+    open_storage,
+    preload_rerun_data,
+    show_rerun_metrics,
+    RerunData,
+    save_new_participant,
+    save_participants_import,
+    save_calendar_for_year,
+    save_calendar,
+    save_payment_changes,
+)
 
 # ============================================================
 # CONFIG STREAMLIT
@@ -15,440 +32,425 @@ st.set_page_config(
     layout="wide"
 )
 
+start_rerun("admin")
+
 # Título centrado con icono
 st.markdown(
     "<h1 style='text-align:center;'>💸 Admin Tanda de cumpleaños</h1>",
     unsafe_allow_html=True,
 )
 
-# ============================================================
-# CONFIG GOOGLE SHEETS
-# ============================================================
-
-SCOPES = [
-    "https://www.googleapis.com/auth/spreadsheets",
-    "https://www.googleapis.com/auth/drive",
-]
-
-creds = Credentials.from_service_account_info(
-    st.secrets["gcp_service_account"],
-    scopes=SCOPES,
-)
-
-client = gspread.authorize(creds)
-
-SHEET_NAME = "TandaDB"
-spreadsheet = client.open(SHEET_NAME)
-
-sheet_participantes = spreadsheet.worksheet("participantes")
-sheet_calendario = spreadsheet.worksheet("calendario")
-
-COLS_PARTICIPANTES = ["id", "nombre", "fecha_cumple", "telefono", "email", "notas"]
-COLS_CALENDARIO = [
-    "id",
-    "anio",
-    "id_participante",
-    "nombre_participante",
-    "fecha_pago",
-    "monto_por_persona",
-    "total_a_recibir",
-    "estatus",
-    "fecha_pago_real",
-    "notas",
-    "pagos_detalle",
-]
-
 # ============================================================
 # BASE DE DATOS
 # ============================================================
 
-def ensure_columns(df, columns):
-    for c in columns:
-        if c not in df.columns:
-            df[c] = ""
-    return df[columns]
-
-def load_participants():
-    df = get_as_dataframe(sheet_participantes, evaluate_formulas=True, header=0)
-    df = df.dropna(how="all")
-    if df.empty:
-        return pd.DataFrame(columns=COLS_PARTICIPANTES)
-    df = ensure_columns(df.fillna(""), COLS_PARTICIPANTES)
-    df["id"] = pd.to_numeric(df["id"], errors="coerce").fillna(0).astype(int)
-    return df
-
-def save_new_participant(nombre, fecha_cumple_dt, telefono, email, notas):
-    df = load_participants()
-    new_id = 1 if df.empty else int(df["id"].max()) + 1
-
-    fecha_str = fecha_cumple_dt.strftime("%Y-%m-%d")
-
-    sheet_participantes.append_row(
-        [new_id, nombre, fecha_str, telefono, email, notas]
+section("conexion")
+
+# Con varias tandas configuradas se elige cuál administrar; la elección va
+# en la URL (?tanda=<id>) para poder compartir el enlace.
+TANDAS = tandas()
+tanda = current_tanda()
+if len(TANDAS) > 1:
+    elegida = st.sidebar.selectbox(
+        "Tanda", list(TANDAS), index=list(TANDAS).index(tanda), format_func=TANDAS.get
     )
+    if elegida != tanda:
+        st.query_params["tanda"] = elegida
+        st.rerun()
+    st.markdown(
+        f"<p style='text-align:center;'>{TANDAS[tanda]}</p>", unsafe_allow_html=True
+    )
+
+storage = open_storage(tanda=tanda)
 
-def load_calendar():
-    df = get_as_dataframe(sheet_calendario, evaluate_formulas=True, header=0)
-    df = df.dropna(how="all")
-    if df.empty:
-        return pd.DataFrame(columns=COLS_CALENDARIO)
-    df = ensure_columns(df.fillna(""), COLS_CALENDARIO)
-    df["id"] = pd.to_numeric(df["id"], errors="coerce").fillna(0).astype(int)
-    df["anio"] = pd.to_numeric(df["anio"], errors="coerce").fillna(
-        datetime.today().year
-    ).astype(int)
-    return df
-
-def save_calendar_for_year(df_new_year, year):
-    df_all = load_calendar()
-    if df_all.empty:
-        df_out = df_new_year.copy()
-    else:
-        df_other = df_all[df_all["anio"] != year]
-        df_out = pd.concat([df_other, df_new_year], ignore_index=True)
-
-    df_out = ensure_columns(df_out, COLS_CALENDARIO)
-    df_out["fecha_pago_dt"] = pd.to_datetime(df_out["fecha_pago"], errors="coerce")
-    df_out = df_out.sort_values(["anio", "fecha_pago_dt", "id"])
-    df_out = df_out.drop(columns=["fecha_pago_dt"])
-
-    sheet_calendario.clear()
-    set_with_dataframe(sheet_calendario, df_out[COLS_CALENDARIO])
+# Con escritura diferida, estado de la cola de cambios.
+if isinstance(storage, WriteBehindStorage):
+    with st.sidebar:
+        st.subheader("Cambios")
+        pendientes = storage.pending_count()
+        if pendientes:
+            st.warning(f"{pendientes} cambio(s) pendiente(s) de enviar.")
+        else:
+            st.success("Todo guardado.")
+        if storage.last_flush:
+            st.caption(f"Último envío: {storage.last_flush}")
+        if storage.last_error:
+            st.error(f"Último envío falló: {storage.last_error}")
+        if pendientes and st.button("Enviar ahora"):
+            storage.flush()
+            st.rerun()
 
 # ============================================================
 # TABS
 # ============================================================
 
-tab1, tab2, tab3 = st.tabs(["👥 Participantes", "📅 Calendario", "💳 Pagos / Estatus"])
+# Solo se ejecuta la pestaña abierta: cambiar de pestaña provoca un rerun y
+# `.open` dice cuál es. Con un Streamlit sin pestañas perezosas se
+# ejecutan todas, como antes.
+TABS = ["👥 Participantes", "📅 Calendario", "💳 Pagos / Estatus"]
+if len(TANDAS) > 1:
+    TABS.append("🗂️ Todas las tandas")
+try:
+    tab1, tab2, tab3, *resto = st.tabs(TABS, key="tabs_admin", on_change="rerun")
+except TypeError:
+    tab1, tab2, tab3, *resto = st.tabs(TABS)
+
+# Datos del rerun: cada conjunto se carga una vez y se recarga al guardar.
+datos = RerunData(storage)
+# Con la pestaña de pagos abierta, los pagos se leen junto con lo demás.
+preload_rerun_data(storage, payments=tab3.open is not False)
 
 # ============================================================
 # TAB 1 – PARTICIPANTES
 # ============================================================
 
-with tab1:
-    st.subheader("Registrar nuevo participante")
-
-    col1, col2 = st.columns(2)
-    with col1:
-        nombre = st.text_input("Nombre completo")
-        # 🔹 Ahora permite fechas desde 1925
-        fecha_cumple = st.date_input(
-            "Fecha de cumpleaños",
-            value=date(1990, 1, 1),
-            min_value=date(1925, 1, 1),
-            max_value=date.today(),
-        )
-    with col2:
-        telefono = st.text_input("Teléfono")
-        email = st.text_input("Email")
-
-    notas = st.text_area("Notas (nickname)", height=70)
-
-    if st.button("Guardar participante"):
-        if not nombre:
-            st.error("El nombre es obligatorio.")
-        else:
-            save_new_participant(nombre, fecha_cumple, telefono, email, notas)
-            st.success("Participante registrado correctamente.")
-
-    st.markdown("---")
-    st.subheader("Lista de participantes")
-
-    dfp = load_participants()
-    if dfp.empty:
-        st.info("Aún no hay participantes.")
-    else:
-        # Una sola tarjeta conteniendo la lista:
-        # • Nombre — Nickname
-        items = []
-        for _, row in dfp.iterrows():
-            nickname = str(row["notas"]).strip()
-            if nickname == "":
-                nickname = "-"
-            items.append(f"<li>{row['nombre']} — {nickname}</li>")
-
-        html_list = (
-            "<ul style='color:#D1D5DB;font-size:16px;margin:0;padding-left:20px;'>"
-            + "".join(items)
-            + "</ul>"
-        )
-
-        st.markdown(
-            f"""
-            <div style="
-                background-color:#111827;
-                padding:16px 18px;
-                border-radius:12px;
-                border:1px solid #374151;
-            ">
-                <h4 style="color:white;margin-top:0;margin-bottom:10px;">
-                    👥 Participantes
-                </h4>
-                {html_list}
-            </div>
-            """,
-            unsafe_allow_html=True,
-        )
-
-# ============================================================
-# TAB 2 – CALENDARIO
-# ============================================================
+section("participantes")
 
-with tab2:
-    st.subheader("Generar calendario de pagos")
+with tab1:
+    if tab1.open is not False:
+        st.subheader("Registrar nuevo participante")
 
-    dfp = load_participants()
-    if dfp.empty:
-        st.warning("Primero registra participantes.")
-    else:
         col1, col2 = st.columns(2)
         with col1:
-            yr = st.number_input(
-                "Año",
-                min_value=2020,
-                max_value=2100,
-                value=datetime.today().year,
-                step=1,
+            nombre = st.text_input("Nombre completo")
+            # 🔹 Ahora permite fechas desde 1925
+            fecha_cumple = st.date_input(
+                "Fecha de cumpleaños",
+                value=date(1990, 1, 1),
+                min_value=date(1925, 1, 1),
+                max_value=date.today(),
             )
         with col2:
-            aporte = st.number_input(
-                "Aporte por persona",
-                min_value=0.0,
-                step=5.0,
-                value=50.0,
-            )
+            telefono = st.text_input("Teléfono")
+            email = st.text_input("Email")
 
-        if st.button("Generar / Reemplazar calendario"):
-            df_cal = load_calendar()
-            max_id = 0 if df_cal.empty else int(df_cal["id"].max())
+        notas = st.text_area("Notas (nickname)", height=70)
+
+        if st.button("Guardar participante"):
+            if not nombre:
+                st.error("El nombre es obligatorio.")
+            else:
+                save_new_participant(storage, nombre, fecha_cumple, telefono, email, notas)
+                datos.refresh()
+                st.success("Participante registrado correctamente.")
+
+        with st.expander("Importar participantes desde CSV / Excel"):
+            st.caption(
+                "Columnas: nombre, fecha_cumple (AAAA-MM-DD o DD/MM/AAAA) y, "
+                "opcionales, telefono, email y notas (nickname)."
+            )
+            archivo = st.file_uploader(
+                "Archivo", type=["csv", "xlsx"], key=f"importar_participantes_{tanda}"
+            )
+            if archivo is not None:
+                try:
+                    with stage("validate_import"):
+                        df_archivo = read_participants_file(archivo)
+                        validos, rechazados = validate_participants(
+                            df_archivo, datos.participants
+                        )
+                except ImportError:
+                    st.error("Para leer archivos .xlsx hace falta instalar openpyxl.")
+                except ValueError as e:
+                    st.error(str(e))
+                else:
+                    st.write(
+                        f"{len(validos)} participantes por importar, "
+                        f"{len(rechazados)} filas rechazadas."
+                    )
+                    if len(rechazados):
+                        st.dataframe(rechazados, use_container_width=True, hide_index=True)
+                    if len(validos):
+                        st.dataframe(validos, use_container_width=True, hide_index=True)
+                        if st.button(f"Importar {len(validos)} participantes"):
+                            ids = save_participants_import(storage, validos)
+                            datos.refresh()
+                            st.success(
+                                f"Se importaron {len(ids)} participantes "
+                                f"(ids {ids[0]} a {ids[-1]})."
+                            )
 
-            rows = []
-            num_total = len(dfp)
-            # El cumpleañero NO aporta
-            num_aportan = max(num_total - 1, 0)
-            total_recibir = aporte * num_aportan
+        st.markdown("---")
+        st.subheader("Lista de participantes")
 
+        dfp = datos.participants
+        if dfp.empty:
+            st.info("Aún no hay participantes.")
+        else:
+            # Una sola tarjeta conteniendo la lista:
+            # • Nombre — Nickname
+            items = []
             for _, row in dfp.iterrows():
-                try:
-                    fcx = datetime.strptime(str(row["fecha_cumple"]), "%Y-%m-%d")
-                except Exception:
-                    fcx = pd.to_datetime(str(row["fecha_cumple"]), errors="coerce")
+                nickname = str(row["notas"]).strip()
+                if nickname == "":
+                    nickname = "-"
+                items.append(f"<li>{row['nombre']} — {nickname}</li>")
+
+            html_list = (
+                "<ul style='color:#D1D5DB;font-size:16px;margin:0;padding-left:20px;'>"
+                + "".join(items)
+                + "</ul>"
+            )
 
-                if pd.isna(fcx):
-                    continue
+            st.markdown(
+                f"""
+                <div style="
+                    background-color:#111827;
+                    padding:16px 18px;
+                    border-radius:12px;
+                    border:1px solid #374151;
+                ">
+                    <h4 style="color:white;margin-top:0;margin-bottom:10px;">
+                        👥 Participantes
+                    </h4>
+                    {html_list}
+                </div>
+                """,
+                unsafe_allow_html=True,
+            )
 
-                try:
-                    fpay = fcx.replace(year=int(yr))
-                except ValueError:
-                    if fcx.month == 2 and fcx.day == 29:
-                        fpay = datetime(int(yr), 2, 28)
-                    else:
-                        continue
-
-                max_id += 1
-                rows.append(
-                    {
-                        "id": max_id,
-                        "anio": int(yr),
-                        "id_participante": int(row["id"]),
-                        "nombre_participante": row["nombre"],
-                        "fecha_pago": fpay.strftime("%Y-%m-%d"),
-                        "monto_por_persona": float(aporte),
-                        "total_a_recibir": float(total_recibir),
-                        "estatus": "Pendiente",
-                        "fecha_pago_real": "",
-                        "notas": "",
-                        "pagos_detalle": "",
-                    }
-                )
+# ============================================================
+# TAB 2 – CALENDARIO
+# ============================================================
 
-            if not rows:
-                st.error("No se pudo generar el calendario. Revisa las fechas de cumpleaños.")
-            else:
-                df_new = pd.DataFrame(rows, columns=COLS_CALENDARIO)
-                save_calendar_for_year(df_new, int(yr))
-                st.success("Calendario generado correctamente.")
+section("calendario")
 
-        st.markdown("---")
-        st.subheader("Vista del calendario")
+with tab2:
+    if tab2.open is not False:
+        st.subheader("Generar calendario de pagos")
 
-        dfc = load_calendar()
-        if dfc.empty:
-            st.info("Aún no hay calendario.")
+        dfp = datos.participants
+        if dfp.empty:
+            st.warning("Primero registra participantes.")
         else:
-            years = sorted(dfc["anio"].unique())
-            sy = st.selectbox(
-                "Año",
-                years,
-                index=years.index(max(years)),
-            )
+            col1, col2 = st.columns(2)
+            with col1:
+                yr = st.number_input(
+                    "Año",
+                    min_value=2020,
+                    max_value=2100,
+                    value=datetime.today().year,
+                    step=1,
+                )
+            with col2:
+                aporte = st.number_input(
+                    "Aporte por persona",
+                    min_value=0.0,
+                    step=5.0,
+                    value=50.0,
+                )
 
-            dfy = dfc[dfc["anio"] == sy].copy()
-            dfy["fecha_pago_dt"] = pd.to_datetime(dfy["fecha_pago"], errors="coerce")
-            dfy = dfy.sort_values("fecha_pago_dt")
-            dfy["fecha_pago"] = dfy["fecha_pago_dt"].dt.strftime("%Y-%m-%d")
+            if st.button("Generar / Reemplazar calendario"):
+                with stage("generate_calendar"):
+                    df_new = generate_calendar(dfp, [int(yr)], aporte)
 
-            st.dataframe(
-                dfy[
-                    [
-                        "nombre_participante",
-                        "fecha_pago",
-                        "monto_por_persona",
-                        "total_a_recibir",
-                        "estatus",
-                    ]
-                ],
-                use_container_width=True,
-            )
+                if df_new.empty:
+                    st.error("No se pudo generar el calendario. Revisa las fechas de cumpleaños.")
+                else:
+                    # Los ids salen del contador (uno por turno generado).
+                    df_new["id"] += storage.allocate_ids("calendario", len(df_new)) - 1
+                    save_calendar_for_year(storage, df_new, int(yr))
+                    datos.refresh()
+                    st.success("Calendario generado correctamente.")
+
+            st.markdown("---")
+            st.subheader("Vista del calendario")
+
+            dfc = datos.calendar
+            if dfc.empty:
+                st.info("Aún no hay calendario.")
+            else:
+                years = sorted(dfc["anio"].unique())
+                sy = st.selectbox(
+                    "Año",
+                    years,
+                    index=years.index(max(years)),
+                )
+
+                dfy = calendar_year(dfc, sy)
+
+                st.dataframe(
+                    dfy[
+                        [
+                            "nombre_participante",
+                            "fecha_pago",
+                            "monto_por_persona",
+                            "total_a_recibir",
+                            "estatus",
+                        ]
+                    ],
+                    use_container_width=True,
+                    column_config={
+                        "fecha_pago": st.column_config.DateColumn(format="YYYY-MM-DD"),
+                    },
+                )
 
 # ============================================================
 # TAB 3 – PAGOS / ESTATUS
 # ============================================================
 
+section("pagos")
+
 with tab3:
-    st.subheader("Actualizar pagos y estatus")
-
-    dfc = load_calendar()
-    if dfc.empty:
-        st.info("Aún no hay calendario.")
-    else:
-        years = sorted(dfc["anio"].unique())
-        sy = st.selectbox(
-            "Año a editar",
-            years,
-            index=years.index(max(years)),
-        )
-
-        dfy = dfc[dfc["anio"] == sy].copy()
-        if dfy.empty:
-            st.info("No hay registros para ese año.")
+    if tab3.open is not False:
+        st.subheader("Actualizar pagos y estatus")
+
+        dfc = datos.calendar
+        if dfc.empty:
+            st.info("Aún no hay calendario.")
         else:
-            dfy["fecha_pago_dt"] = pd.to_datetime(dfy["fecha_pago"], errors="coerce")
-            dfy = dfy.sort_values("fecha_pago_dt")
-
-            df_edit = dfy.copy()
-            df_edit["fecha_pago"] = df_edit["fecha_pago_dt"].dt.strftime("%Y-%m-%d")
-
-            st.write("Edita estatus y fecha real de pago (opcional):")
-            edited = st.data_editor(
-                df_edit[
-                    [
-                        "id",
-                        "nombre_participante",
-                        "fecha_pago",
-                        "monto_por_persona",
-                        "total_a_recibir",
-                        "estatus",
-                        "fecha_pago_real",
-                        "notas",
-                    ]
-                ],
-                num_rows="fixed",
-                use_container_width=True,
-                key="editor_pagos_generales",
-                column_config={
-                    "id": st.column_config.NumberColumn(disabled=True),
-                    "nombre_participante": st.column_config.TextColumn(disabled=True),
-                    "fecha_pago": st.column_config.TextColumn(disabled=True),
-                    "monto_por_persona": st.column_config.NumberColumn(disabled=True),
-                    "total_a_recibir": st.column_config.NumberColumn(disabled=True),
-                },
+            years = sorted(dfc["anio"].unique())
+            sy = st.selectbox(
+                "Año a editar",
+                years,
+                index=years.index(max(years)),
             )
 
-            if st.button("Guardar cambios generales"):
-                for _, row in edited.iterrows():
-                    mask = dfy["id"] == row["id"]
-                    dfy.loc[mask, "estatus"] = row["estatus"]
-                    dfy.loc[mask, "fecha_pago_real"] = row["fecha_pago_real"]
-                    dfy.loc[mask, "notas"] = row["notas"]
-
-                df_all = load_calendar()
-                df_out = pd.concat(
-                    [df_all[df_all["anio"] != sy], dfy],
-                    ignore_index=True,
+            dfy = calendar_year(dfc, sy)
+            if dfy.empty:
+                st.info("No hay registros para ese año.")
+            else:
+                st.write("Edita estatus y fecha real de pago (opcional):")
+                editor_key = f"editor_pagos_generales_{tanda}_{sy}"
+                st.data_editor(
+                    dfy[
+                        [
+                            "id",
+                            "nombre_participante",
+                            "fecha_pago",
+                            "monto_por_persona",
+                            "total_a_recibir",
+                            "estatus",
+                            "fecha_pago_real",
+                            "notas",
+                        ]
+                    ],
+                    num_rows="fixed",
+                    use_container_width=True,
+                    key=editor_key,
+                    column_config={
+                        "id": st.column_config.NumberColumn(disabled=True),
+                        "nombre_participante": st.column_config.TextColumn(disabled=True),
+                        "fecha_pago": st.column_config.DateColumn(
+                            disabled=True, format="YYYY-MM-DD"
+                        ),
+                        "monto_por_persona": st.column_config.NumberColumn(disabled=True),
+                        "total_a_recibir": st.column_config.NumberColumn(disabled=True),
+                    },
                 )
-                df_out = ensure_columns(df_out, COLS_CALENDARIO)
-
-                sheet_calendario.clear()
-                set_with_dataframe(sheet_calendario, df_out[COLS_CALENDARIO])
-
-                st.success("Cambios guardados correctamente.")
 
-            st.markdown("---")
-            st.subheader("Control de pagos por integrante")
+                if st.button("Guardar cambios generales"):
+                    # Solo las filas que el editor reporta como tocadas, unidas
+                    # por id con el año recién leído; se guardan las que de
+                    # verdad cambiaron.
+                    tocadas = st.session_state[editor_key].get("edited_rows", {})
+                    ids = dfy["id"].to_numpy()
+                    ediciones = {
+                        int(ids[int(pos)]): {c: v for c, v in cols.items() if c in CAMPOS_EDITABLES}
+                        for pos, cols in tocadas.items()
+                    }
+                    df_old, df_new = merge_calendar_edits(storage.load_calendar(sy), ediciones)
 
-            dfp = load_participants()
-            if dfp.empty:
-                st.info("No hay participantes.")
-            else:
-                opciones = []
-                ids_turno = []
-
-                for _, r in dfy.iterrows():
-                    fecha_lbl = (
-                        r["fecha_pago_dt"].strftime("%Y-%m-%d")
-                        if not pd.isna(r["fecha_pago_dt"])
-                        else str(r["fecha_pago"])
-                    )
-                    opciones.append(f"{r['nombre_participante']} — {fecha_lbl}")
-                    ids_turno.append(int(r["id"]))
-
-                if opciones:
-                    sel = st.selectbox(
-                        "Selecciona la tanda",
-                        opciones,
-                        key="select_tanda_control",
-                    )
-                    idx_sel = opciones.index(sel)
-                    id_turno = ids_turno[idx_sel]
-
-                    row_t = dfy[dfy["id"] == id_turno].iloc[0]
-
-                    pagos_raw = str(row_t.get("pagos_detalle", "")).strip()
-                    pagados = set()
-                    if pagos_raw:
-                        for x in pagos_raw.split(","):
-                            x = x.strip()
-                            if x.isdigit():
-                                pagados.add(int(x))
-
-                    fecha_lbl = (
-                        row_t["fecha_pago_dt"].strftime("%Y-%m-%d")
-                        if not pd.isna(row_t["fecha_pago_dt"])
-                        else str(row_t["fecha_pago"])
+                    if df_new.empty:
+                        st.info("No hay cambios que guardar.")
+                    else:
+                        save_calendar(storage, df_old, df_new)
+                        datos.refresh()
+                        st.success(f"Cambios guardados correctamente ({len(df_new)} turnos).")
+
+                st.markdown("---")
+                st.subheader("Control de pagos por integrante")
+
+                dfp = datos.participants
+                if dfp.empty:
+                    st.info("No hay participantes.")
+                else:
+                    # Una fila por participante y una columna por turno del año;
+                    # al guardar se envían solo las celdas que cambiaron.
+                    fechas_lbl = dfy["fecha_pago"].dt.strftime("%m-%d").fillna("-")
+                    etiquetas = (fechas_lbl + " " + dfy["nombre_participante"].astype(str)).tolist()
+                    if len(set(etiquetas)) < len(etiquetas):
+                        etiquetas = [f"{e} #{i}" for e, i in zip(etiquetas, dfy["id"])]
+                    ids_turno = dfy["id"].to_numpy()
+
+                    dfp_u = dfp.drop_duplicates("id")
+                    pagos = PaymentMatrix.from_frame(datos.payments, dfy["id"], dfp_u["id"])
+                    original = pagos.dense().T
+
+                    matriz = pd.DataFrame(original, columns=etiquetas)
+                    matriz.insert(0, "Participante", dfp_u["nombre"].to_numpy())
+
+                    st.caption(
+                        "Marca quién ya hizo su aporte en cada tanda del año "
+                        "(columnas por fecha de pago)."
                     )
-
-                    st.write(
-                        f"Pagos para **{row_t['nombre_participante']}** — {fecha_lbl}"
+                    editada = st.data_editor(
+                        matriz,
+                        num_rows="fixed",
+                        hide_index=True,
+                        use_container_width=True,
+                        key=f"matriz_pagos_{tanda}_{sy}",
+                        column_config={
+                            "Participante": st.column_config.TextColumn(disabled=True),
+                            **{e: st.column_config.CheckboxColumn(e) for e in etiquetas},
+                        },
                     )
-                    st.caption("Marca quién ya hizo su aporte para esta tanda.")
-
-                    checks = {}
-                    for _, p in dfp.iterrows():
-                        pid = int(p["id"])
-                        checks[pid] = st.checkbox(
-                            p["nombre"],
-                            value=(pid in pagados),
-                            key=f"chk_{id_turno}_{pid}",
-                        )
 
                     if st.button("Guardar control de pagos"):
-                        new_pagos = [pid for pid, v in checks.items() if v]
-                        pagos_str = ",".join(str(x) for x in new_pagos)
+                        nuevo = editada[etiquetas].to_numpy(dtype=bool)
+                        pids = pagos.participant_ids
+                        cambios = list(zip(*(nuevo != original).nonzero()))
+                        marcar = [
+                            (int(ids_turno[c]), int(pids[f])) for f, c in cambios if nuevo[f, c]
+                        ]
+                        desmarcar = [
+                            (int(ids_turno[c]), int(pids[f])) for f, c in cambios if not nuevo[f, c]
+                        ]
+                        # Turnos con todos los aportes: pasan a "Completado".
+                        pendiente = (dfy["estatus"] != "Completado").to_numpy()
+                        completos = ids_turno[nuevo.all(axis=0) & pendiente]
+
+                        save_payment_changes(
+                            storage, marcar, desmarcar, completed=completos.tolist(), year=sy
+                        )
+                        datos.refresh()
+                        st.success(
+                            f"Control de pagos actualizado ({len(marcar)} marcados, "
+                            f"{len(desmarcar)} desmarcados)."
+                        )
 
-                        dfy.loc[dfy["id"] == id_turno, "pagos_detalle"] = pagos_str
+# ============================================================
+# TAB 4 – TODAS LAS TANDAS
+# ============================================================
 
-                        if len(new_pagos) >= len(dfp):
-                            dfy.loc[dfy["id"] == id_turno, "estatus"] = "Completado"
+if resto:
+    section("todas")
 
-                        df_all = load_calendar()
-                        df_out = pd.concat(
-                            [df_all[df_all["anio"] != sy], dfy],
-                            ignore_index=True,
-                        )
-                        df_out = ensure_columns(df_out, COLS_CALENDARIO)
+    with resto[0]:
+        if resto[0].open is not False:
+            st.subheader("Todas las tandas")
+            st.caption("Próximo en recibir y turnos pendientes del año en curso de cada tanda.")
+            df_todas = overview(pd.Timestamp(datetime.today().date()))
+            st.dataframe(
+                df_todas,
+                hide_index=True,
+                use_container_width=True,
+                column_config={
+                    "tanda": "Tanda",
+                    "participantes": "Participantes",
+                    "anio": st.column_config.NumberColumn("Año", format="%d"),
+                    "pendientes": "Pendientes",
+                    "completados": "Completados",
+                    "proximo_nombre": "Próximo en recibir",
+                    "proximo_fecha": st.column_config.DateColumn("Fecha", format="YYYY-MM-DD"),
+                    "error": "Error",
+                },
+            )
 
-                        sheet_calendario.clear()
-                        set_with_dataframe(sheet_calendario, df_out[COLS_CALENDARIO])
+# ============================================================
+# TIEMPOS DEL RERUN
+# ============================================================
 
-                        st.success("Control de pagos actualizado.")
+rerun = finish_rerun()
+if st.sidebar.toggle("Mostrar tiempos", key="mostrar_tiempos"):
+    show_rerun_metrics(rerun, tanda)
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+from tanda_storage import COLS_CALENDARIO, ESTATUS, parse_dates
+
+# ============================================================
+# GENERACIÓN DE CALENDARIO
+# ============================================================
+
+def generate_calendar(participants, years, aporte, start_id=1):
+    # Un turno por participante y año. El cumpleañero no aporta, así que
+    # recibe aporte * (participantes - 1). Quien nació un 29 de febrero
+    # cobra el 28 en años no bisiestos. Los ids son consecutivos desde
+    # start_id, año por año en el orden de `participants`.
+    years = np.atleast_1d(np.asarray(years, dtype=np.int64))
+    num_aportan = max(len(participants) - 1, 0)
+    total_recibir = float(aporte) * num_aportan
+
+    nacimiento = parse_dates(participants["fecha_cumple"])
+    valid = nacimiento.notna().to_numpy()
+    if not valid.any() or len(years) == 0:
+        return pd.DataFrame(columns=COLS_CALENDARIO)
+
+    meses = nacimiento.dt.month.to_numpy()[valid].astype(np.int64)
+    dias = nacimiento.dt.day.to_numpy()[valid].astype(np.int64)
+    pids = participants["id"].to_numpy()[valid].astype(np.int64)
+    nombres = participants["nombre"].to_numpy()[valid]
+
+    n = len(pids)
+    anio = np.repeat(years, n)
+    mes = np.tile(meses, len(years))
+    dia = np.tile(dias, len(years))
+
+    bisiesto = (anio % 4 == 0) & ((anio % 100 != 0) | (anio % 400 == 0))
+    dia = np.where((mes == 2) & (dia == 29) & ~bisiesto, 28, dia)
+
+    fecha_pago = pd.to_datetime(pd.DataFrame({"year": anio, "month": mes, "day": dia}))
+
+    return pd.DataFrame(
+        {
+            "id": np.arange(start_id, start_id + len(anio), dtype=np.int32),
+            "anio": anio.astype(np.int32),
+            "id_participante": np.tile(pids, len(years)).astype(np.int32),
+            "nombre_participante": np.tile(nombres, len(years)),
+            "fecha_pago": fecha_pago,
+            "monto_por_persona": float(aporte),
+            "total_a_recibir": total_recibir,
+            "estatus": pd.Categorical(["Pendiente"] * len(anio), categories=ESTATUS),
+            "fecha_pago_real": "",
+            "notas": "",
+            "pagos_detalle": "",
+        },
+        columns=COLS_CALENDARIO,
+    )
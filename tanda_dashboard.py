@@ -1,19 +1,40 @@
+import html
+
 import streamlit as st
 import pandas as pd
 from datetime import datetime
 
-from google.oauth2.service_account import Credentials
-import gspread
-from gspread_dataframe import get_as_dataframe
+from tanda_storage import calendar_year, current_summary
+from tanda_metrics import start_rerun, section, finish_rerun
+from tanda_db import (
+    DEFAULT_TANDA,
+    current_tanda,
+    tanda_config,
+    tandas,
+    open_storage,
+    preload_rerun_data,
+    load_participants,
+    load_calendar,
+    load_summary,
+    computed_summary,
+)
 
 # ============================================================
 # CONFIG STREAMLIT
 # ============================================================
 st.set_page_config(page_title="Tanda de cumpleaños", page_icon="💸", layout="wide")
 
+start_rerun("dashboard")
+
+# Con varias tandas, cada grupo entra con su enlace (?tanda=<id>).
+tanda = current_tanda()
+titulo = "Tanda de cumpleaños"
+if len(tandas()) > 1:
+    titulo = f"{titulo} · {html.escape(tandas()[tanda])}"
+
 # Título centrado
 st.markdown(
-    "<h1 style='text-align:center;'>💸 Tanda de cumpleaños</h1>",
+    f"<h1 style='text-align:center;'>💸 {titulo}</h1>",
     unsafe_allow_html=True,
 )
 
@@ -37,72 +58,49 @@ hide_streamlit_style = """
 st.markdown(hide_streamlit_style, unsafe_allow_html=True)
 
 # ============================================================
-# CONFIG: GOOGLE SHEETS (SOLO LECTURA)
+# BASE DE DATOS (SOLO LECTURA)
 # ============================================================
 
-SCOPES = [
-    "https://www.googleapis.com/auth/spreadsheets.readonly",
-    "https://www.googleapis.com/auth/drive.readonly",
-]
-
-creds = Credentials.from_service_account_info(
-    st.secrets["gcp_service_account"],
-    scopes=SCOPES,
-)
+section("conexion")
 
-client = gspread.authorize(creds)
-
-SHEET_NAME = "TandaDB"
-spreadsheet = client.open(SHEET_NAME)
-
-sheet_participantes = spreadsheet.worksheet("participantes")
-sheet_calendario = spreadsheet.worksheet("calendario")
-
-COLS_PARTICIPANTES = ["id", "nombre", "fecha_cumple", "telefono", "email", "notas"]
-COLS_CALENDARIO = [
-    "id",
-    "anio",
-    "id_participante",
-    "nombre_participante",
-    "fecha_pago",
-    "monto_por_persona",
-    "total_a_recibir",
-    "estatus",
-    "fecha_pago_real",
-    "notas",
-    "pagos_detalle",
-]
+storage = open_storage(readonly=True, tanda=tanda)
 
 # ============================================================
-# FUNCIONES BASE DE DATOS
+# HTML DE SECCIONES (UN SOLO ELEMENTO POR SECCIÓN)
 # ============================================================
+# Cada sección se arma como un único bloque HTML con operaciones de texto
+# vectorizadas y se memoriza por la versión de los datos: si no cambiaron,
+# el bloque no se reconstruye. Los argumentos con "_" no forman la llave.
+
+def _texto(serie):
+    return serie.astype(str).map(html.escape)
+
+def _fechas(df):
+    return df["fecha_pago"].dt.strftime("%Y-%m-%d").fillna("-")
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def calendar_cards_html(version, _df):
+    cards = (
+        '<div style="background-color:#111827;padding:12px 15px;border-radius:10px;'
+        'margin-bottom:8px;border:1px solid #374151;">'
+        '<div style="font-size:16px;font-weight:bold;color:white;">📆 '
+        + _texto(_df["nombre_participante"])
+        + '</div><div style="color:#D1D5DB;"><b>Fecha de pago:</b> '
+        + _fechas(_df)
+        + "</div></div>"
+    )
+    return "".join(cards.tolist())
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def turn_items_html(version, _df):
+    items = "<li>" + _texto(_df["nombre_participante"]) + " — " + _fechas(_df) + "</li>"
+    return "".join(items.tolist())
 
-def ensure_columns(df, columns):
-    for c in columns:
-        if c not in df.columns:
-            df[c] = ""
-    return df[columns]
-
-def load_participants():
-    df = get_as_dataframe(sheet_participantes, evaluate_formulas=True, header=0)
-    df = df.dropna(how="all")
-    if df.empty:
-        return pd.DataFrame(columns=COLS_PARTICIPANTES)
-    df = ensure_columns(df.fillna(""), COLS_PARTICIPANTES)
-    df["id"] = pd.to_numeric(df["id"], errors="coerce").fillna(0).astype(int)
-    return df
-
-def load_calendar():
-    df = get_as_dataframe(sheet_calendario, evaluate_formulas=True, header=0)
-    df = df.dropna(how="all")
-    if df.empty:
-        return pd.DataFrame(columns=COLS_CALENDARIO)
-    df = ensure_columns(df.fillna(""), COLS_CALENDARIO)
-    df["id"] = pd.to_numeric(df["id"], errors="coerce").fillna(0).astype(int)
-    df["anio"] = pd.to_numeric(df["anio"], errors="coerce").fillna(
-        datetime.today().year
-    ).astype(int)
-    return df
+@st.cache_data(show_spinner=False, max_entries=8)
+def participant_items_html(version, _df):
+    nick = _df["notas"].astype(str).str.strip().replace("", "-")
+    items = "<li>" + _texto(_df["nombre"]) + " — " + nick.map(html.escape) + "</li>"
+    return "".join(items.tolist())
 
 # ============================================================
 # LOGIN CON PIN (SOLO LECTURA)
@@ -110,8 +108,13 @@ def load_calendar():
 
 PASSWORD = "1111"  # PIN para tus amigos
 
+# Cada tanda puede tener su PIN (`pin` en [tandas.<id>]); entrar a una no
+# abre las demás.
+PIN = str(tanda_config(tanda).get("pin", PASSWORD))
+AUTH_KEY = "auth_dashboard" if tanda == DEFAULT_TANDA else f"auth_dashboard_{tanda}"
+
 def check_password():
-    if st.session_state.get("auth_dashboard", False):
+    if st.session_state.get(AUTH_KEY, False):
         return True
 
     st.subheader("🔐 Acceso a la Tanda")
@@ -121,8 +124,8 @@ def check_password():
         submit = st.form_submit_button("Entrar")
 
     if submit:
-        if pwd == PASSWORD:
-            st.session_state["auth_dashboard"] = True
+        if pwd == PIN:
+            st.session_state[AUTH_KEY] = True
             st.rerun()
         else:
             st.error("PIN incorrecto")
@@ -133,47 +136,42 @@ if not check_password():
     st.stop()
 
 # ============================================================
-# CARGA DE DATOS
+# RESUMEN PRECALCULADO
 # ============================================================
+# Las tarjetas y el próximo en recibir salen del resumen que mantiene el
+# admin (una lectura mínima). Si aún no existe o el próximo ya pasó, se
+# calcula aquí con los datos completos.
 
-participants_df = load_participants()
-calendar_df = load_calendar()
+section("resumen_precalculado")
 
-if not calendar_df.empty:
-    available_years = sorted(calendar_df["anio"].unique())
-else:
-    available_years = []
+# Solo el resumen: las tarjetas se dibujan sin esperar los datos completos,
+# que se cargan más abajo.
+preload_rerun_data(storage, data=False, summary=True)
 
-# Selección automática del año más reciente
-if available_years:
-    selected_year = max(available_years)
-else:
-    selected_year = None
+hoy = pd.Timestamp(datetime.today().date())
+resumen = current_summary(load_summary(storage), hoy)
+if resumen is None:
+    resumen = current_summary(
+        computed_summary(load_participants(storage), load_calendar(storage), hoy), hoy
+    )
+if resumen is None:
     st.warning("Todavía no hay calendario cargado en Google Sheets.")
 
-# Filtrar por año seleccionado
-if selected_year is not None:
-    df_year = calendar_df[calendar_df["anio"] == selected_year].copy()
-    if not df_year.empty:
-        df_year["fecha_pago_dt"] = pd.to_datetime(
-            df_year["fecha_pago"], errors="coerce"
-        )
-    else:
-        df_year["fecha_pago_dt"] = pd.NaT
-else:
-    df_year = pd.DataFrame(columns=COLS_CALENDARIO)
-    df_year["fecha_pago_dt"] = pd.NaT
-
 st.markdown("---")
 
 # ============================================================
 # TARJETAS RESUMEN
 # ============================================================
 
+section("resumen")
+
 col1, col2, col3 = st.columns(3)
 
 # 👥 Participantes
-num_participants = len(participants_df)
+if resumen is not None:
+    num_participants = int(resumen["participantes"])
+else:
+    num_participants = len(load_participants(storage))
 with col1:
     st.markdown(
         f"""
@@ -188,8 +186,8 @@ with col1:
     )
 
 # 💸 Aporte por persona
-if not df_year.empty:
-    aporte_por_persona = float(df_year["monto_por_persona"].iloc[0])
+if resumen is not None:
+    aporte_por_persona = float(resumen["monto_por_persona"])
 else:
     aporte_por_persona = 0.0
 
@@ -209,8 +207,8 @@ with col2:
     )
 
 # 💰 Monto por cumpleañero
-if not df_year.empty:
-    monto_por_cumpleanero = float(df_year["total_a_recibir"].iloc[0])
+if resumen is not None:
+    monto_por_cumpleanero = float(resumen["total_a_recibir"])
 else:
     monto_por_cumpleanero = 0.0
 
@@ -235,33 +233,18 @@ st.markdown("---")
 # PRÓXIMO EN RECIBIR
 # ============================================================
 
-st.subheader("🎉 Próximo en recibir su tanda")
-
-if not df_year.empty:
-    hoy = datetime.today().date()
+section("proximo")
 
-    df_year["fecha_pago_dt"] = pd.to_datetime(df_year["fecha_pago_dt"], errors="coerce")
-
-    futuros = df_year[
-        df_year["fecha_pago_dt"].notna()
-        & (df_year["fecha_pago_dt"].dt.date >= hoy)
-    ].sort_values("fecha_pago_dt")
-
-    if not futuros.empty:
-        nr = futuros.iloc[0]
-    else:
-        df_valid = df_year[df_year["fecha_pago_dt"].notna()].sort_values("fecha_pago_dt")
-        if not df_valid.empty:
-            nr = df_valid.iloc[-1]
-        else:
-            nr = df_year.iloc[0]
+st.subheader("🎉 Próximo en recibir su tanda")
 
-    if not pd.isna(nr["fecha_pago_dt"]):
-        fecha_pago_dt = nr["fecha_pago_dt"]
-        fecha_str = fecha_pago_dt.strftime("%Y-%m-%d")
-        mes_pago = fecha_pago_dt.month
+if resumen is not None:
+    # El próximo en recibir ya viene calculado en el resumen, buscando en
+    # todos los años (con respaldo al último turno si no quedan futuros).
+    if not pd.isna(resumen["proximo_fecha"]):
+        fecha_str = resumen["proximo_fecha"].strftime("%Y-%m-%d")
+        mes_pago = resumen["proximo_fecha"].month
     else:
-        fecha_str = str(nr["fecha_pago"])
+        fecha_str = "-"
         mes_pago = hoy.month  # fallback
 
     # Tarjeta principal
@@ -269,11 +252,11 @@ if not df_year.empty:
         f"""
         <div style="background-color:#111827;padding:20px;border-radius:15px;
                     border:1px solid #374151;">
-            <h2 style="margin-top:0;color:white;">🎂 {nr['nombre_participante']}</h2>
+            <h2 style="margin-top:0;color:white;">🎂 {resumen['proximo_nombre']}</h2>
             <p style="color:#D1D5DB;"><b>Fecha de pago:</b> {fecha_str}</p>
             <p style="color:#D1D5DB;"><b>Monto a recibir:</b>
-                ${float(nr['total_a_recibir']):,.2f}</p>
-            <p style="color:#D1D5DB;"><b>Estatus:</b> {nr['estatus']}</p>
+                ${float(resumen['proximo_total']):,.2f}</p>
+            <p style="color:#D1D5DB;"><b>Estatus:</b> {resumen['proximo_estatus']}</p>
         </div>
         """,
         unsafe_allow_html=True,
@@ -284,21 +267,9 @@ if not df_year.empty:
     # CON FRASE SEGÚN MES
     # =====================================================
 
-    # Intentar obtener nickname desde participantes (campo notas)
-    nickname = ""
-    try:
-        pid = int(nr.get("id_participante", 0))
-        p_row = participants_df[participants_df["id"] == pid]
-        if not p_row.empty:
-            nickname = str(p_row.iloc[0].get("notas", "")).strip()
-    except Exception:
-        nickname = ""
-
-    # Fallbacks de nickname
-    if nickname == "":
-        nickname = str(nr.get("notas", "")).strip()
-    if nickname == "":
-        nickname = nr["nombre_participante"]
+    # Nickname desde participantes (campo notas), con respaldo a las notas
+    # del turno y al nombre; ya resuelto en el resumen.
+    nickname = resumen["proximo_nickname"]
 
     # Frase según el mes del pago
     def frase_por_mes(mes: int) -> str:
@@ -344,41 +315,52 @@ else:
 
 st.markdown("---")
 
+# ============================================================
+# CARGA DE DATOS (SECCIONES DE ABAJO)
+# ============================================================
+
+section("carga")
+
+preload_rerun_data(storage)
+participants_df = load_participants(storage)
+calendar_df = load_calendar(storage)
+
+if not calendar_df.empty:
+    available_years = sorted(calendar_df["anio"].unique())
+else:
+    available_years = []
+
+# Selección automática del año más reciente
+if available_years:
+    selected_year = max(available_years)
+else:
+    selected_year = None
+
+# Filtrar por año seleccionado. Los datos ya vienen tipados y ordenados por
+# fecha; df_year es de solo lectura y lo comparten todas las secciones.
+if selected_year is not None:
+    df_year = calendar_year(calendar_df, selected_year)
+else:
+    df_year = calendar_df.iloc[0:0]
+
+# Llave de memoización de las secciones del año.
+year_version = f"{calendar_df.attrs.get('version')}:{selected_year}"
+
 # ============================================================
 # CALENDARIO DE PAGOS COMO TARJETAS
 # ============================================================
 
+section("calendario")
+
 st.subheader("📅 Calendario de pagos")
 
 if df_year.empty:
     st.info("No hay calendario para el año actual de la tanda.")
 else:
-    df_calendar_sorted = df_year.copy()
-    df_calendar_sorted["fecha_pago_dt"] = pd.to_datetime(
-        df_calendar_sorted["fecha_pago_dt"], errors="coerce"
+    st.markdown(
+        calendar_cards_html(year_version, df_year),
+        unsafe_allow_html=True,
     )
-    df_calendar_sorted = df_calendar_sorted.sort_values("fecha_pago_dt")
-
-    for _, row in df_calendar_sorted.iterrows():
-        if not pd.isna(row["fecha_pago_dt"]):
-            fecha_str = row["fecha_pago_dt"].strftime("%Y-%m-%d")
-        else:
-            fecha_str = str(row["fecha_pago"])
-
-        st.markdown(
-            f"""
-            <div style="background-color:#111827;padding:12px 15px;border-radius:10px;
-                        margin-bottom:8px;border:1px solid #374151;">
-                <div style="font-size:16px;font-weight:bold;color:white;">
-                    📆 {row['nombre_participante']}
-                </div>
-                <div style="color:#D1D5DB;">
-                    <b>Fecha de pago:</b> {fecha_str}
-                </div>
-            </div>
-            """,
-            unsafe_allow_html=True,
-        )
 
 st.markdown("---")
 
@@ -386,21 +368,16 @@ st.markdown("---")
 # LISTA DE PARTICIPANTES
 # ============================================================
 
+section("participantes")
+
 st.subheader("👥 Participantes")
 
 if participants_df.empty:
     st.info("Aún no hay participantes registrados.")
 else:
-    items = []
-    for _, row in participants_df.iterrows():
-        nickname_p = str(row.get("notas", "")).strip()
-        if nickname_p == "":
-            nickname_p = "-"
-        items.append(f"<li>{row['nombre']} — {nickname_p}</li>")
-
     lista_html = (
         "<ul style='color:#D1D5DB;font-size:16px;margin:0;padding-left:20px;'>"
-        + "".join(items)
+        + participant_items_html(participants_df.attrs.get("version"), participants_df)
         + "</ul>"
     )
 
@@ -427,20 +404,15 @@ st.markdown("---")
 # HISTORIAL: DOS TARJETAS (RECIBIERON / PENDIENTES)
 # ============================================================
 
+section("historial")
+
 st.subheader("📜 Historial de la tanda")
 
 if df_year.empty:
     st.info("No hay historial para el año actual de la tanda.")
 else:
-    df_hist = df_year.copy()
-    df_hist["fecha_pago_dt"] = pd.to_datetime(df_hist["fecha_pago_dt"], errors="coerce")
-
-    recibieron = df_hist[df_hist["estatus"] == "Completado"].sort_values(
-        "fecha_pago_dt"
-    )
-    pendientes = df_hist[df_hist["estatus"] == "Pendiente"].sort_values(
-        "fecha_pago_dt"
-    )
+    recibieron = df_year[df_year["estatus"] == "Completado"]
+    pendientes = df_year[df_year["estatus"] == "Pendiente"]
 
     col_r, col_p = st.columns(2)
 
@@ -449,14 +421,8 @@ else:
         if recibieron.empty:
             contenido_r = "<p style='color:#D1D5DB;'>— Ninguno todavía.</p>"
         else:
-            items_r = []
-            for _, row in recibieron.iterrows():
-                if not pd.isna(row["fecha_pago_dt"]):
-                    fecha_str = row["fecha_pago_dt"].strftime("%Y-%m-%d")
-                else:
-                    fecha_str = str(row["fecha_pago"])
-                items_r.append(f"<li>{row['nombre_participante']} — {fecha_str}</li>")
-            contenido_r = "<ul style='color:#D1D5DB;'>" + "".join(items_r) + "</ul>"
+            items_r = turn_items_html(f"{year_version}:recibieron", recibieron)
+            contenido_r = "<ul style='color:#D1D5DB;'>" + items_r + "</ul>"
 
         st.markdown(
             f"""
@@ -474,14 +440,8 @@ else:
         if pendientes.empty:
             contenido_p = "<p style='color:#D1D5DB;'>— Ninguno pendiente.</p>"
         else:
-            items_p = []
-            for _, row in pendientes.iterrows():
-                if not pd.isna(row["fecha_pago_dt"]):
-                    fecha_str = row["fecha_pago_dt"].strftime("%Y-%m-%d")
-                else:
-                    fecha_str = str(row["fecha_pago"])
-                items_p.append(f"<li>{row['nombre_participante']} — {fecha_str}</li>")
-            contenido_p = "<ul style='color:#D1D5DB;'>" + "".join(items_p) + "</ul>"
+            items_p = turn_items_html(f"{year_version}:pendientes", pendientes)
+            contenido_p = "<ul style='color:#D1D5DB;'>" + items_p + "</ul>"
 
         st.markdown(
             f"""
@@ -498,6 +458,8 @@ else:
 # FRASE MOTIVACIONAL FINAL
 # ============================================================
 
+section("frase")
+
 st.markdown("---")
 
 st.markdown(
@@ -519,3 +481,5 @@ st.markdown(
     """,
     unsafe_allow_html=True,
 )
+
+finish_rerun()
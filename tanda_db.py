@@ -0,0 +1,531 @@
+import functools
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from google.auth.transport.requests import AuthorizedSession
+from google.oauth2.service_account import Credentials
+import gspread
+
+from tanda_storage import SheetsStorage, SQLiteStorage, current_summary, summarize
+from tanda_loader import fetch_all
+from tanda_metrics import stage
+from tanda_queue import WriteBehindStorage
+from tanda_refresh import RefreshingStorage
+from tanda_schedule import UpcomingIndex
+from tanda_snapshot import SnapshotStorage, SnapshotStore
+from tanda_quota import QuotaHTTPClient, RequestBudget
+
+# ============================================================
+# CONFIG ALMACENAMIENTO
+# ============================================================
+# En secrets.toml:
+#
+#   [storage]
+#   backend = "sheets"   # o "sqlite"
+#   path = "tanda.db"    # solo sqlite
+#   write_behind = true  # opcional: el admin escribe en una cola local
+#   queue_path = "tanda_cola.db"
+#   flush_interval = 5   # segundos entre envíos
+#   snapshot_dir = "tanda_snapshot"  # opcional: foto local para el dashboard
+#   refresh_interval = 60  # segundos entre recargas de la copia del
+#                          # dashboard (0 la desactiva; por defecto cache_ttl)
+#   load_timeout = 30      # segundos máximos de las lecturas en paralelo
+#
+#   [quota]
+#   per_minute = 55      # peticiones a Sheets por minuto (todo el proceso)
+#   burst = 10
+#
+#   [tandas.familia]     # opcional: varias tandas en un mismo despliegue
+#   nombre = "Familia"
+#   sheet = "TandaFamilia"   # spreadsheet de esta tanda
+#   pin = "1234"             # PIN de su dashboard
+#   per_minute = 20          # cuota propia, dentro de la de [quota]
+#
+# Sin sección [storage] se usa Google Sheets como siempre. Cada tanda toma
+# lo de [storage] y puede cambiar cualquier clave; se elige con
+# ?tanda=familia en la URL. Sin [tandas] hay una sola ("default") en
+# SHEET_NAME.
+
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive",
+]
+SCOPES_READONLY = [
+    "https://www.googleapis.com/auth/spreadsheets.readonly",
+    "https://www.googleapis.com/auth/drive.readonly",
+]
+
+SHEET_NAME = "TandaDB"
+DEFAULT_TANDA = "default"
+
+# Segundos que una lectura se comparte entre reruns y sesiones.
+# Se ajusta con `cache_ttl` en secrets.toml; cada escritura la invalida.
+CACHE_TTL = int(st.secrets.get("cache_ttl", 60))
+
+# Tiempo máximo para las lecturas en paralelo de un arranque en frío.
+LOAD_TIMEOUT = float(st.secrets.get("storage", {}).get("load_timeout", 30))
+
+logger = logging.getLogger("tanda")
+
+# ============================================================
+# TANDAS
+# ============================================================
+
+def tandas():
+    # {id: nombre visible} de las tandas configuradas, en orden.
+    config = st.secrets.get("tandas", {})
+    if not config:
+        return {DEFAULT_TANDA: "Tanda de cumpleaños"}
+    return {tid: cfg.get("nombre", tid) for tid, cfg in config.items()}
+
+def tanda_config(tanda):
+    # [storage] con lo de [tandas.<id>] encima. Los archivos locales que se
+    # heredan llevan el id para que dos tandas no los compartan.
+    config = dict(st.secrets.get("storage", {}))
+    propia = dict(st.secrets.get("tandas", {}).get(tanda, {}))
+    if tanda != DEFAULT_TANDA:
+        for clave, defecto in (("path", "tanda.db"), ("queue_path", "tanda_cola.db")):
+            if clave not in propia:
+                raiz, ext = os.path.splitext(config.get(clave, defecto))
+                propia[clave] = f"{raiz}_{tanda}{ext}"
+        if "snapshot_dir" in config and "snapshot_dir" not in propia:
+            propia["snapshot_dir"] = os.path.join(config["snapshot_dir"], tanda)
+    config.update(propia)
+
+    if tanda == DEFAULT_TANDA:
+        config.setdefault("sheet", SHEET_NAME)
+    if config.get("backend", "sheets") != "sqlite" and not config.get("sheet"):
+        raise ValueError(f"Falta `sheet` en [tandas.{tanda}].")
+    return config
+
+def current_tanda():
+    # ?tanda=<id> en la URL; si no viene o no existe, la primera.
+    ids = list(tandas())
+    elegida = st.query_params.get("tanda")
+    return elegida if elegida in ids else ids[0]
+
+# ============================================================
+# CONEXIÓN (COMPARTIDA ENTRE RERUNS, SESIONES Y TANDAS)
+# ============================================================
+# Streamlit vuelve a ejecutar el script en cada interacción; las
+# credenciales, la sesión HTTP y las hojas abiertas se guardan como
+# recursos del proceso para no repetir la autorización ni client.open().
+# Todas las tandas usan la misma sesión (un token, un pool de conexiones);
+# cada una tiene su propio cliente para llevar su cuota.
+
+@st.cache_resource(show_spinner=False)
+def _credentials(readonly):
+    return Credentials.from_service_account_info(
+        st.secrets["gcp_service_account"],
+        scopes=SCOPES_READONLY if readonly else SCOPES,
+    )
+
+@st.cache_resource(show_spinner=False)
+def _session(readonly):
+    return AuthorizedSession(_credentials(readonly))
+
+@st.cache_resource(show_spinner=False)
+def request_budget(tanda=None):
+    # Sin tanda, el presupuesto de todo el proceso (todas las sesiones y
+    # ambos clientes). Con tanda, el suyo, que también gasta del total.
+    config = st.secrets.get("quota", {})
+    per_minute = config.get("per_minute", 55)
+    burst = config.get("burst", 10)
+    if tanda is None:
+        return RequestBudget(per_minute=per_minute, burst=burst)
+    propia = tanda_config(tanda)
+    return RequestBudget(
+        per_minute=propia.get("per_minute", per_minute),
+        burst=propia.get("burst", burst),
+        parent=request_budget(),
+    )
+
+def _open_spreadsheet(tanda, readonly, fresh=False):
+    # Cliente de la tanda sobre la sesión compartida. Al reconectar se abre
+    # una sesión nueva (el token se refresca solo).
+    session = AuthorizedSession(_credentials(readonly)) if fresh else _session(readonly)
+    http_client = functools.partial(QuotaHTTPClient, budget=request_budget(tanda))
+    client = gspread.authorize(None, http_client=http_client, session=session)
+    return client.open(tanda_config(tanda)["sheet"])
+
+def _open_backend(tanda, config, readonly):
+    if config.get("backend", "sheets") == "sqlite":
+        return SQLiteStorage(config.get("path", "tanda.db"))
+    return SheetsStorage(
+        _open_spreadsheet(tanda, readonly),
+        reconnect=lambda: _open_spreadsheet(tanda, readonly, fresh=True),
+    )
+
+@st.cache_resource(show_spinner=False)
+def snapshot_store(tanda):
+    # Carpeta compartida por el admin (publica) y el dashboard (lee); sin
+    # `snapshot_dir` no hay foto local.
+    path = tanda_config(tanda).get("snapshot_dir")
+    return SnapshotStore(path) if path else None
+
+def publish_snapshot(tanda, participants, calendar, summary):
+    store = snapshot_store(tanda)
+    if store is None:
+        return
+    with stage("publish_snapshot"):
+        try:
+            store.publish(participants, calendar, summary)
+        except OSError as exc:
+            # La foto es una copia: si falla, el dashboard sigue con la
+            # anterior (o con Sheets) y se reintenta en la siguiente escritura.
+            logger.warning("publish_snapshot: %s", exc)
+
+@st.cache_resource(show_spinner=False)
+def _storage(tanda, readonly):
+    storage = _build_storage(tanda, readonly)
+    # Las lecturas con caché usan la tanda en su llave.
+    storage.tanda = tanda
+    return storage
+
+def _build_storage(tanda, readonly):
+    config = tanda_config(tanda)
+
+    if readonly:
+        # El dashboard lee la foto local; Sheets solo se abre si aún no hay
+        # una. Encima, una copia en memoria que se recarga en segundo plano:
+        # ningún visitante espera una lectura salvo el primero del proceso.
+        store = snapshot_store(tanda)
+        if store is not None:
+            storage = SnapshotStorage(store, lambda: _open_backend(tanda, config, readonly))
+        else:
+            storage = _open_backend(tanda, config, readonly)
+        intervalo = float(config.get("refresh_interval", CACHE_TTL))
+        if intervalo <= 0:
+            return storage
+        return RefreshingStorage(storage, intervalo, timeout=LOAD_TIMEOUT)
+
+    storage = _open_backend(tanda, config, readonly)
+
+    # Hojas antiguas: el calendario se reparte por año y `pagos_detalle` pasa
+    # al registro de pagos una vez por proceso (solo el admin tiene permiso
+    # de escritura).
+    anios = storage.migrate_partitions()
+    if anios:
+        logger.info("migrate_partitions: %d años repartidos", anios)
+    migrados = storage.migrate_pagos_detalle()
+    if migrados:
+        logger.info("migrate_pagos_detalle: %d pagos migrados", migrados)
+    # Los contadores de ids se alinean con los datos por si se agregaron
+    # filas a mano en la hoja.
+    storage.rebuild_sequences()
+    # El resumen del dashboard (y su foto local) queda al día al menos
+    # una vez por proceso (el próximo en recibir cambia con la fecha).
+    participants, calendar = storage.load_all()
+    summary = summarize(participants, calendar, index=upcoming_index(calendar))
+    storage.write_summary(summary)
+    publish_snapshot(tanda, participants, calendar, summary)
+
+    if config.get("write_behind", False):
+        storage = WriteBehindStorage(
+            storage,
+            config.get("queue_path", "tanda_cola.db"),
+            flush_interval=config.get("flush_interval", 5),
+            on_flush=functools.partial(publish_snapshot, tanda),
+        )
+    return storage
+
+def open_storage(readonly=False, tanda=None):
+    tanda = tanda or current_tanda()
+    inicio = time.perf_counter()
+    with stage("open_storage"):
+        storage = _storage(tanda, readonly)
+    # En frío incluye autorización y apertura; en caliente debe ser ~0 ms.
+    logger.info(
+        "open_storage %s readonly=%s: %.1f ms",
+        tanda, readonly, (time.perf_counter() - inicio) * 1000,
+    )
+    return storage
+
+# ============================================================
+# LECTURAS CON CACHÉ
+# ============================================================
+# Hay un almacenamiento por tanda, así que `_storage` no forma parte de la
+# llave del caché pero la tanda sí. Las escrituras leen directo de
+# `storage` para no calcular ids ni reescribir a partir de datos viejos.
+# Con foto local o copia en memoria, su versión también es parte de la
+# llave: una versión nueva se lee en el siguiente rerun sin esperar al TTL.
+# Esas versiones no cambian, así que se guardan en st.cache_resource y se
+# comparten sin copiar (st.cache_data serializa una copia en cada lectura,
+# lo que anularía el memory map de la foto). Quien las lee no las modifica.
+
+def data_version(df):
+    # Huella del contenido; las secciones que memorizan HTML la usan como
+    # llave para no reconstruirlo si los datos no cambiaron.
+    if df.empty:
+        return "0"
+    return format(int(pd.util.hash_pandas_object(df, index=False).sum()) & (2**64 - 1), "x")
+
+def _read_data(storage):
+    # Participantes y calendario en una sola lectura (un solo viaje a Sheets).
+    participants, calendar = storage.load_all()
+    participants.attrs["version"] = data_version(participants)
+    calendar.attrs["version"] = data_version(calendar)
+    return participants, calendar
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def load_data(_storage, tanda):
+    return _read_data(_storage)
+
+@st.cache_resource(ttl=CACHE_TTL, show_spinner=False)
+def _shared_data(_storage, tanda, version):
+    return _read_data(_storage)
+
+def _data(storage, tanda, version):
+    if version is None:
+        return load_data(storage, tanda)
+    return _shared_data(storage, tanda, version)
+
+def _cache_key(storage):
+    return storage.tanda, storage.snapshot_version()
+
+def load_participants(storage):
+    with stage("load_participants"):
+        return _data(storage, *_cache_key(storage))[0]
+
+def load_calendar(storage):
+    with stage("load_calendar"):
+        return _data(storage, *_cache_key(storage))[1]
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def _load_payments(_storage, tanda):
+    return _storage.load_payments()
+
+def load_payments(storage):
+    with stage("load_payments"):
+        return _load_payments(storage, storage.tanda)
+
+class RerunData:
+    # Los datos de un rerun. Cada conjunto se pide al caché una sola vez
+    # (cada lectura de st.cache_data deserializa una copia) y refresh()
+    # los descarta después de guardar.
+
+    def __init__(self, storage):
+        self.storage = storage
+        self._datos = {}
+
+    def _get(self, nombre, loader):
+        if nombre not in self._datos:
+            self._datos[nombre] = loader(self.storage)
+        return self._datos[nombre]
+
+    @property
+    def participants(self):
+        return self._get("participants", load_participants)
+
+    @property
+    def calendar(self):
+        return self._get("calendar", load_calendar)
+
+    @property
+    def payments(self):
+        return self._get("payments", load_payments)
+
+    def refresh(self):
+        self._datos.clear()
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def _load_summary(_storage, tanda):
+    return _storage.load_summary()
+
+@st.cache_resource(ttl=CACHE_TTL, show_spinner=False)
+def _shared_summary(_storage, tanda, version):
+    return _storage.load_summary()
+
+def _summary(storage, tanda, version):
+    if version is None:
+        return _load_summary(storage, tanda)
+    return _shared_summary(storage, tanda, version)
+
+def load_summary(storage):
+    with stage("load_summary"):
+        return _summary(storage, *_cache_key(storage))
+
+def _with_context(fn):
+    # Los hilos del pool usan el contexto del rerun, como el script.
+    ctx = get_script_run_ctx()
+
+    def correr():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn()
+    return correr
+
+def preload_rerun_data(storage, data=True, summary=False, payments=False):
+    # Llena a la vez los cachés que el rerun va a leer, para que en frío se
+    # espere la lectura más lenta y no la suma; después load_participants()
+    # y compañía salen del caché. Participantes y calendario son
+    # obligatorios; si resumen o pagos fallan aquí, se reintentan (y
+    # muestran su error) cuando la página los pida.
+    llave = _cache_key(storage)
+    tareas = {}
+    if data:
+        tareas["datos"] = (_with_context(lambda: _data(storage, *llave)), None)
+    if summary:
+        tareas["resumen"] = (
+            _with_context(lambda: _summary(storage, *llave)), lambda: None
+        )
+    if payments:
+        tareas["pagos"] = (
+            _with_context(lambda: _load_payments(storage, storage.tanda)), lambda: None
+        )
+    with stage("preload_rerun_data"):
+        fetch_all(tareas, timeout=LOAD_TIMEOUT)
+
+@st.cache_resource(ttl=CACHE_TTL, show_spinner=False, max_entries=8)
+def _upcoming_index(version, day, _calendar):
+    return UpcomingIndex(_calendar)
+
+def upcoming_index(calendar, day=None):
+    # Índice de próximos en recibir, uno por versión del calendario y día:
+    # se ordena una vez y lo comparten el resumen y el dashboard (solo
+    # lectura, así que no se copia en cada rerun).
+    day = pd.Timestamp(day if day is not None else datetime.today().date())
+    version = calendar.attrs.get("version") or data_version(calendar)
+    return _upcoming_index(version, day, calendar)
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False, max_entries=4)
+def _computed_summary(version, day, _participants, _calendar):
+    return summarize(_participants, _calendar, day, index=upcoming_index(_calendar, day))
+
+def computed_summary(participants, calendar, day):
+    # Resumen calculado aquí mismo (si el guardado no sirve), uno por
+    # versión de los datos y día.
+    version = f"{participants.attrs.get('version')}:{calendar.attrs.get('version')}"
+    with stage("computed_summary"):
+        return _computed_summary(version, day, participants, calendar)
+
+def invalidate_cache(storage):
+    # Solo las entradas de la tanda de `storage`.
+    tanda, version = _cache_key(storage)
+    if version is None:
+        load_data.clear(storage, tanda)
+        _load_summary.clear(storage, tanda)
+    else:
+        _shared_data.clear(storage, tanda, version)
+        _shared_summary.clear(storage, tanda, version)
+    _load_payments.clear(storage, tanda)
+
+def _after_write(storage):
+    # Tras cada escritura: caché fuera y resumen recalculado. La lectura del
+    # resumen queda en caché para el siguiente rerun, así que no cuesta una
+    # consulta extra. Con escritura diferida, el resumen y la foto los
+    # escribe la cola al enviar: aquí no se espera a Sheets.
+    invalidate_cache(storage)
+    if isinstance(storage, WriteBehindStorage):
+        return
+    participants, calendar = _data(storage, *_cache_key(storage))
+    summary = summarize(participants, calendar, index=upcoming_index(calendar))
+    with stage("write_summary"):
+        storage.write_summary(summary)
+    publish_snapshot(storage.tanda, participants, calendar, summary)
+
+# ============================================================
+# ESCRITURAS
+# ============================================================
+
+def save_new_participant(storage, nombre, fecha_cumple_dt, telefono, email, notas):
+    fecha_str = fecha_cumple_dt.strftime("%Y-%m-%d")
+    with stage("save_participant"):
+        storage.add_participant(nombre, fecha_str, telefono, email, notas)
+    _after_write(storage)
+
+def save_participants_import(storage, df):
+    # df: los válidos de validate_participants.
+    with stage("import_participants"):
+        ids = storage.add_participants(df)
+    _after_write(storage)
+    return ids
+
+def save_calendar_for_year(storage, df_new_year, year):
+    with stage("save_calendar_for_year"):
+        storage.replace_calendar_year(df_new_year, year)
+    _after_write(storage)
+
+def save_calendar(storage, df_old, df_new):
+    with stage("save_calendar"):
+        storage.write_calendar(df_old, df_new)
+    _after_write(storage)
+
+def save_payment_changes(storage, marcar, desmarcar, completed=(), year=None):
+    with stage("save_payment_changes"):
+        storage.save_payment_changes(marcar, desmarcar, completed, year)
+    _after_write(storage)
+
+# ============================================================
+# TODAS LAS TANDAS (ADMIN)
+# ============================================================
+# Próximo en recibir y turnos pendientes de cada tanda. Cada una se lee en
+# su hilo (ver tanda_loader); una que falla sale con su error y no detiene
+# a las demás. Se usa el almacenamiento de solo lectura (el del dashboard):
+# abrir el del admin migraría y reescribiría las hojas de cada tanda.
+
+def _tanda_overview(tanda, nombre, hoy):
+    storage = _storage(tanda, True)
+    resumen = current_summary(load_summary(storage), hoy)
+    if resumen is None:
+        resumen = current_summary(
+            computed_summary(load_participants(storage), load_calendar(storage), hoy), hoy
+        ) or {"participantes": len(load_participants(storage))}
+    return {
+        "tanda": nombre,
+        "participantes": resumen.get("participantes", 0),
+        "anio": resumen.get("anio"),
+        "pendientes": resumen.get("pendientes", 0),
+        "completados": resumen.get("completados", 0),
+        "proximo_nombre": resumen.get("proximo_nombre", ""),
+        "proximo_fecha": resumen.get("proximo_fecha"),
+        "error": "",
+    }
+
+def overview(hoy):
+    tareas = {
+        tid: (
+            _with_context(functools.partial(_tanda_overview, tid, nombre, hoy)),
+            lambda nombre=nombre: {"tanda": nombre, "error": "No se pudo leer"},
+        )
+        for tid, nombre in tandas().items()
+    }
+    with stage("overview"):
+        filas = fetch_all(tareas, timeout=LOAD_TIMEOUT)
+    return pd.DataFrame(list(filas.values()))
+
+# ============================================================
+# PANEL DE TIEMPOS (ADMIN)
+# ============================================================
+
+def show_rerun_metrics(rerun, tanda=None):
+    # Desglose del rerun que acaba de terminar (ver tanda_metrics).
+    if rerun is None:
+        return
+    with st.sidebar:
+        st.subheader("⏱️ Tiempos")
+        st.caption(
+            f"Total {rerun.total_ms:.0f} ms · {rerun.api_calls} llamadas a Sheets "
+            f"({rerun.api_bytes / 1024:.1f} KB, {rerun.api_ms:.0f} ms)"
+        )
+        etapas = pd.DataFrame(rerun.to_dict()["stages"])
+        if not etapas.empty:
+            etapas["stage"] = etapas["depth"].map(lambda d: "· " * d) + etapas["stage"]
+            st.dataframe(
+                etapas[["stage", "ms", "api_calls", "api_bytes"]],
+                hide_index=True,
+                use_container_width=True,
+            )
+        if st.secrets.get("storage", {}).get("backend", "sheets") != "sqlite":
+            st.caption("Cuota del proceso")
+            st.json(request_budget().metrics(), expanded=False)
+            if tanda is not None and len(tandas()) > 1:
+                st.caption(f"Cuota de {tandas()[tanda]}")
+                st.json(request_budget(tanda).metrics(), expanded=False)
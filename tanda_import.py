@@ -0,0 +1,125 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from tanda_storage import COLS_PARTICIPANTES, parse_dates
+
+# ============================================================
+# IMPORTACIÓN DE PARTICIPANTES (CSV / EXCEL)
+# ============================================================
+# Se valida todo el archivo en una pasada por columnas (sin recorrer filas):
+# nombre obligatorio, cumpleaños entre 1925 y hoy (AAAA-MM-DD o
+# DD/MM/AAAA; el 29 de febrero solo en años bisiestos) y sin repetir a
+# alguien ya registrado ni dentro del mismo archivo. Lo válido se guarda con
+# ids consecutivos y una sola escritura (ver add_participants).
+
+COLS_IMPORTAR = [c for c in COLS_PARTICIPANTES if c != "id"]
+FECHA_MINIMA = pd.Timestamp(1925, 1, 1)
+
+# Encabezados alternativos que se aceptan en el archivo.
+ALIAS_COLUMNAS = {
+    "nombre completo": "nombre",
+    "cumpleaños": "fecha_cumple",
+    "cumpleanos": "fecha_cumple",
+    "fecha de cumpleaños": "fecha_cumple",
+    "fecha": "fecha_cumple",
+    "nickname": "notas",
+    "correo": "email",
+}
+
+# AAAA-MM-DD o DD/MM/AAAA (también con "-"), con una hora opcional detrás
+# (Excel la agrega a las celdas de fecha).
+_ISO = r"^(?P<y>\d{4})-(?P<m>\d{1,2})-(?P<d>\d{1,2})(?:[ T][\d:.]*)?$"
+_DMY = r"^(?P<d>\d{1,2})[/-](?P<m>\d{1,2})[/-](?P<y>\d{4})(?:[ T][\d:.]*)?$"
+
+def read_participants_file(archivo):
+    # `archivo`: lo que devuelve st.file_uploader (o una ruta). Todo se lee
+    # como texto para no perder ceros a la izquierda en los teléfonos.
+    nombre = str(getattr(archivo, "name", archivo)).lower()
+    if nombre.endswith((".xlsx", ".xls")):
+        df = pd.read_excel(archivo, dtype=str)
+    else:
+        df = pd.read_csv(archivo, dtype=str, sep=None, engine="python", encoding="utf-8-sig")
+
+    columnas = [str(c).strip().lower() for c in df.columns]
+    df.columns = [ALIAS_COLUMNAS.get(c, c) for c in columnas]
+    if "nombre" not in df.columns or "fecha_cumple" not in df.columns:
+        raise ValueError("El archivo debe tener las columnas 'nombre' y 'fecha_cumple'.")
+    df = df.loc[:, ~df.columns.duplicated()]
+    for c in COLS_IMPORTAR:
+        if c not in df.columns:
+            df[c] = ""
+    return df[COLS_IMPORTAR].fillna("").astype(str).apply(lambda c: c.str.strip())
+
+def _name_key(nombres):
+    # Mayúsculas, acentos y espacios repetidos no cuentan al comparar.
+    nombres = nombres.astype(str).str.strip().str.replace(r"\s+", " ", regex=True).str.casefold()
+    return nombres.str.normalize("NFKD").str.encode("ascii", "ignore").str.decode("ascii")
+
+def _parse_birthdays(texto):
+    # (fechas, año, mes, día, reconocida); año/mes/día salen del texto aunque
+    # la fecha no exista, para poder explicar el 29 de febrero.
+    partes = texto.str.extract(_ISO)
+    dmy = texto.str.extract(_DMY)
+    faltan = partes["y"].isna()
+    partes.loc[faltan, ["y", "m", "d"]] = dmy.loc[faltan, ["y", "m", "d"]].to_numpy()
+    reconocida = partes["y"].notna()
+
+    partes = partes.apply(pd.to_numeric, errors="coerce").astype("float64")
+    fechas = pd.to_datetime(
+        pd.DataFrame({"year": partes["y"], "month": partes["m"], "day": partes["d"]}),
+        errors="coerce",
+    )
+    return fechas, partes["y"], partes["m"], partes["d"], reconocida
+
+def validate_participants(df, existing, hoy=None):
+    # df: salida de read_participants_file. Devuelve (validos, rechazados):
+    # validos con COLS_IMPORTAR y la fecha como AAAA-MM-DD; rechazados con la
+    # fila del archivo y el motivo.
+    hoy = pd.Timestamp(hoy if hoy is not None else datetime.today().date())
+    fechas, anio, mes, dia, reconocida = _parse_birthdays(df["fecha_cumple"])
+
+    bisiesto = (anio % 4 == 0) & ((anio % 100 != 0) | (anio % 400 == 0))
+    claves = _name_key(df["nombre"]) + "|" + fechas.dt.strftime("%Y-%m-%d").fillna("")
+
+    # Cruce por hash contra los ya registrados (misma persona = mismo nombre
+    # normalizado y mismo cumpleaños).
+    registradas = pd.Index(
+        _name_key(existing["nombre"])
+        + "|"
+        + parse_dates(existing["fecha_cumple"]).dt.strftime("%Y-%m-%d").fillna("")
+    )
+    ya_registrado = claves.isin(registradas)
+
+    condiciones = [
+        df["nombre"].eq(""),
+        ~reconocida,
+        (mes == 2) & (dia == 29) & ~bisiesto,
+        fechas.isna(),
+        fechas < FECHA_MINIMA,
+        fechas > hoy,
+        ya_registrado,
+        claves.duplicated(),
+    ]
+    motivos = [
+        "Falta el nombre",
+        "Fecha no reconocida (usa AAAA-MM-DD o DD/MM/AAAA)",
+        "29 de febrero en un año no bisiesto",
+        "Fecha inválida",
+        "Fecha anterior a 1925",
+        "Fecha en el futuro",
+        "Ya está registrado",
+        "Repetido en el archivo",
+    ]
+    motivo = pd.Series(np.select(condiciones, motivos, default=""), index=df.index)
+    ok = motivo.eq("")
+
+    validos = df.loc[ok, COLS_IMPORTAR].copy()
+    validos["fecha_cumple"] = fechas[ok].dt.strftime("%Y-%m-%d")
+
+    rechazados = df.loc[~ok, ["nombre", "fecha_cumple"]].copy()
+    # Fila como se ve en el archivo: el encabezado es la 1.
+    rechazados.insert(0, "fila", np.flatnonzero(~ok.to_numpy()) + 2)
+    rechazados["motivo"] = motivo[~ok]
+    return validos.reset_index(drop=True), rechazados.reset_index(drop=True)
@@ -0,0 +1,64 @@
+import logging
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+
+from tanda_metrics import bind
+
+logger = logging.getLogger("tanda")
+
+# ============================================================
+# LECTURAS EN PARALELO
+# ============================================================
+# Las lecturas independientes de un arranque en frío (participantes y
+# calendario, resumen, pagos) se lanzan a la vez en hilos, así que la espera
+# es la de la más lenta y no la suma. Cada tarea es obligatoria u opcional:
+#   - obligatoria: si falla o no termina a tiempo, fetch_all lanza el error
+#     (sin esperar a las demás);
+#   - opcional: se registra en el log y se usa su valor por defecto.
+# Los hilos no se pueden cancelar: una tarea que se pasa del tiempo sigue
+# corriendo en segundo plano y su resultado se descarta. Lo que hagan las
+# tareas (llamadas a la API, etapas) cuenta en el rerun que las lanzó.
+
+class LoadError(RuntimeError):
+    pass
+
+def fetch_all(tareas, timeout=30.0):
+    # tareas: {nombre: (función, por_defecto)}; por_defecto es None para las
+    # obligatorias o una función que da el valor de respaldo. Devuelve
+    # {nombre: resultado} cuando todas terminaron.
+    if not tareas:
+        return {}
+    inicio = time.perf_counter()
+    pool = ThreadPoolExecutor(max_workers=len(tareas), thread_name_prefix="tanda-load")
+    try:
+        futuros = {nombre: pool.submit(bind(fn)) for nombre, (fn, _) in tareas.items()}
+        obligatorias = [futuros[n] for n, (_, defecto) in tareas.items() if defecto is None]
+        # Primero las obligatorias: si una falla no hay por qué esperar.
+        wait(obligatorias, timeout=timeout, return_when=FIRST_EXCEPTION)
+        for futuro in obligatorias:
+            if futuro.done() and futuro.exception() is not None:
+                raise futuro.exception()
+        restante = max(0.0, timeout - (time.perf_counter() - inicio))
+        wait([f for f in futuros.values() if f not in obligatorias], timeout=restante)
+
+        resultados = {}
+        for nombre, futuro in futuros.items():
+            defecto = tareas[nombre][1]
+            if not futuro.done():
+                if defecto is None:
+                    raise LoadError(f"{nombre}: sin respuesta en {timeout:g} s")
+                logger.warning("fetch_all %s: sin respuesta en %g s", nombre, timeout)
+                resultados[nombre] = defecto()
+            elif futuro.exception() is not None:
+                if defecto is None:
+                    raise futuro.exception()
+                logger.warning("fetch_all %s: %s", nombre, futuro.exception())
+                resultados[nombre] = defecto()
+            else:
+                resultados[nombre] = futuro.result()
+        logger.info(
+            "fetch_all %s: %.1f ms", ",".join(tareas), (time.perf_counter() - inicio) * 1000
+        )
+        return resultados
+    finally:
+        pool.shutdown(wait=False)
@@ -0,0 +1,142 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("tanda")
+
+# ============================================================
+# MEDICIÓN POR RERUN
+# ============================================================
+# Cada ejecución del script (rerun) abre un registro con start_rerun() y lo
+# cierra con finish_rerun(), que lo escribe en el log como una línea JSON.
+# Dentro se miden etapas:
+#   - section("nombre"): marca el inicio de una sección del script; dura
+#     hasta la siguiente sección (no hace falta reindentar el código).
+#   - with stage("nombre"): una operación dentro de la sección actual
+#     (conexión, cada carga, cada guardado...).
+#   - annotate("clave", valor): un dato suelto del rerun (p. ej. la edad de
+#     los datos servidos).
+# Las llamadas a la API de Sheets se cuentan en todas las etapas abiertas.
+# Streamlit ejecuta cada rerun en su hilo, así que el registro es por hilo.
+# Los hilos que el rerun lanza para leer en paralelo lo comparten con
+# bind(); lo que pase en otros hilos (p. ej. la cola de escritura) no se
+# cuenta.
+
+_local = threading.local()
+
+class RerunMetrics:
+
+    def __init__(self, app):
+        self.app = app
+        self.stages = []
+        self.api_calls = 0
+        self.api_bytes = 0
+        self.api_ms = 0.0
+        self._open = []
+        self._section = None
+        self._started = time.perf_counter()
+        self.total_ms = None
+        self.extra = {}
+        # Varios hilos pueden escribir a la vez (ver bind).
+        self._lock = threading.Lock()
+
+    def _begin(self, name, depth):
+        entry = {"stage": name, "depth": depth, "ms": 0.0, "api_calls": 0, "api_bytes": 0}
+        entry["_inicio"] = time.perf_counter()
+        with self._lock:
+            self.stages.append(entry)
+            self._open.append(entry)
+        return entry
+
+    def _end(self, entry):
+        entry["ms"] = round((time.perf_counter() - entry.pop("_inicio")) * 1000, 1)
+        with self._lock:
+            self._open = [e for e in self._open if e is not entry]
+
+    def to_dict(self):
+        return {
+            "app": self.app,
+            "total_ms": self.total_ms,
+            "api_calls": self.api_calls,
+            "api_bytes": self.api_bytes,
+            "api_ms": round(self.api_ms, 1),
+            "stages": [
+                {k: v for k, v in e.items() if not k.startswith("_")} for e in self.stages
+            ],
+            **self.extra,
+        }
+
+def start_rerun(app):
+    _local.rerun = RerunMetrics(app)
+    return _local.rerun
+
+def current():
+    return getattr(_local, "rerun", None)
+
+def bind(fn):
+    # `fn` envuelta para correr en otro hilo con el registro del rerun
+    # actual: sus llamadas a la API y sus etapas cuentan en él.
+    rerun = current()
+    if rerun is None:
+        return fn
+
+    def correr(*args, **kwargs):
+        previo = current()
+        _local.rerun = rerun
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.rerun = previo
+    return correr
+
+def section(name):
+    rerun = current()
+    if rerun is None:
+        return
+    if rerun._section is not None:
+        rerun._end(rerun._section)
+    rerun._section = rerun._begin(name, 0)
+
+@contextmanager
+def stage(name):
+    rerun = current()
+    if rerun is None:
+        yield
+        return
+    entry = rerun._begin(name, 1 if rerun._section is not None else 0)
+    try:
+        yield
+    finally:
+        rerun._end(entry)
+
+def annotate(key, value):
+    rerun = current()
+    if rerun is not None:
+        with rerun._lock:
+            rerun.extra[key] = value
+
+def record_api_call(nbytes, seconds):
+    rerun = current()
+    if rerun is None:
+        return
+    with rerun._lock:
+        rerun.api_calls += 1
+        rerun.api_bytes += nbytes
+        rerun.api_ms += seconds * 1000
+        for entry in rerun._open:
+            entry["api_calls"] += 1
+            entry["api_bytes"] += nbytes
+
+def finish_rerun():
+    rerun = current()
+    if rerun is None:
+        return None
+    if rerun._section is not None:
+        rerun._end(rerun._section)
+        rerun._section = None
+    rerun.total_ms = round((time.perf_counter() - rerun._started) * 1000, 1)
+    logger.info("rerun %s", json.dumps(rerun.to_dict(), ensure_ascii=False))
+    _local.rerun = None
+    return rerun
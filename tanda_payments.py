@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+# ============================================================
+# MATRIZ DE PAGOS EN MEMORIA
+# ============================================================
+# Un bit por (turno, participante), empaquetado con np.packbits a lo largo
+# de los participantes: una fila por turno del calendario. Así:
+#   - "¿quién ya pagó este turno?"  -> una fila, desempaquetada
+#   - "¿qué turnos pagó esta persona?" -> un bit de cada fila (vectorizado)
+#   - "¿pagó X el turno Y?"          -> un acceso O(1)
+
+class PaymentMatrix:
+
+    def __init__(self, calendar_ids, participant_ids, bits):
+        self.calendar_ids = np.asarray(calendar_ids, dtype=np.int64)
+        self.participant_ids = np.asarray(participant_ids, dtype=np.int64)
+        self._turno_pos = {int(c): i for i, c in enumerate(self.calendar_ids)}
+        self._part_pos = {int(p): j for j, p in enumerate(self.participant_ids)}
+        self._bits = bits
+
+    @classmethod
+    def from_frame(cls, pagos, calendar_ids, participant_ids):
+        calendar_ids = pd.Index(pd.unique(np.asarray(calendar_ids, dtype=np.int64)))
+        participant_ids = pd.Index(pd.unique(np.asarray(participant_ids, dtype=np.int64)))
+
+        filas = calendar_ids.get_indexer(pagos["id_calendario"].astype(np.int64))
+        cols = participant_ids.get_indexer(pagos["id_participante"].astype(np.int64))
+        ok = (filas >= 0) & (cols >= 0)
+
+        dense = np.zeros((len(calendar_ids), len(participant_ids)), dtype=bool)
+        dense[filas[ok], cols[ok]] = True
+        return cls(calendar_ids, participant_ids, np.packbits(dense, axis=1))
+
+    def _bit(self, fila, col):
+        return (self._bits[fila, col >> 3] >> (7 - (col & 7))) & 1
+
+    def is_paid(self, calendar_id, participant_id):
+        fila = self._turno_pos.get(int(calendar_id))
+        col = self._part_pos.get(int(participant_id))
+        if fila is None or col is None:
+            return False
+        return bool(self._bit(fila, col))
+
+    def paid_for_turn(self, calendar_id):
+        fila = self._turno_pos.get(int(calendar_id))
+        if fila is None:
+            return set()
+        row = np.unpackbits(self._bits[fila], count=len(self.participant_ids)).astype(bool)
+        return set(self.participant_ids[row].tolist())
+
+    def turns_paid_by(self, participant_id):
+        col = self._part_pos.get(int(participant_id))
+        if col is None:
+            return set()
+        return set(self.calendar_ids[self._bit(slice(None), col).astype(bool)].tolist())
+
+    def dense(self):
+        # Matriz booleana turnos x participantes (en el orden de los ids).
+        return np.unpackbits(self._bits, axis=1, count=len(self.participant_ids)).astype(bool)
+
+    def paid_counts(self):
+        # Aportes registrados por turno, en el orden de calendar_ids.
+        dense = np.unpackbits(self._bits, axis=1, count=len(self.participant_ids))
+        return pd.Series(dense.sum(axis=1), index=self.calendar_ids)
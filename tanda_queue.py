@@ -0,0 +1,304 @@
+import atexit
+import json
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+import pandas as pd
+
+from tanda_storage import (
+    TandaStorage,
+    diff_calendar,
+    normalize_calendar,
+    normalize_payments,
+    now_str,
+    summarize,
+)
+
+logger = logging.getLogger("tanda")
+
+# ============================================================
+# ESCRITURA DIFERIDA (WRITE-BEHIND)
+# ============================================================
+# Las escrituras del admin se guardan primero en una cola local (un archivo
+# SQLite, sobrevive a reinicios) y un hilo las envía cada pocos segundos.
+# Antes de enviar se juntan: varias ediciones de la misma celda quedan en la
+# última, las marcas de pago en su estado final y todo el calendario de un
+# año sale en un solo write_calendar. Las lecturas del calendario y de los
+# pagos ven los cambios que aún están en la cola; los participantes nuevos
+# aparecen cuando se envían (su id se asigna entonces).
+#
+# Solo se difieren altas de participantes, celdas del calendario y marcas de
+# pago. Lo que agrega o borra turnos (generar un año) vacía la cola y se
+# escribe en el momento.
+#
+# Cada envío termina con el resumen recalculado y escrito una vez; con
+# `on_flush` (participantes, calendario, resumen) se avisa a quien publica
+# la foto local.
+
+QUEUE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cola (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    tipo TEXT NOT NULL,
+    datos TEXT NOT NULL,
+    creado TEXT NOT NULL
+);
+"""
+
+def _coalesce(items):
+    # items: [(tipo, datos)] en orden. Devuelve participantes por agregar,
+    # {anio: {id: {col: valor}}} y {(id_calendario, id_participante): bool}.
+    participantes = []
+    celdas = {}
+    pagos = {}
+    for tipo, datos in items:
+        if tipo == "participante":
+            participantes.append(datos)
+        elif tipo == "celdas":
+            for cid, anio, col, valor in datos:
+                celdas.setdefault(int(anio), {}).setdefault(int(cid), {})[col] = valor
+        elif tipo == "pagos":
+            for cid, pid, pagado in datos:
+                pagos[(int(cid), int(pid))] = bool(pagado)
+    return participantes, celdas, pagos
+
+def _apply_cells(df, cambios):
+    # cambios: {id: {col: valor}} con valores ya normalizados (cell_value).
+    if df.empty or not cambios:
+        return df
+    df = df.astype(object)
+    for cid, cols in cambios.items():
+        mask = df["id"] == cid
+        for col, valor in cols.items():
+            df.loc[mask, col] = valor
+    return df
+
+class WriteBehindStorage(TandaStorage):
+
+    def __init__(self, storage, path, flush_interval=5.0, on_flush=None):
+        self.storage = storage
+        self.path = path
+        self.flush_interval = float(flush_interval)
+        self.on_flush = on_flush
+        self.last_flush = None
+        self.last_error = None
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        with closing(self._connect()) as conn:
+            conn.executescript(QUEUE_SCHEMA)
+
+        self._worker = threading.Thread(target=self._run, name="tanda-write-behind", daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+        if self.pending_count():
+            # Quedó algo de una ejecución anterior.
+            self._wake.set()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    # ---------------- cola ----------------
+
+    def _enqueue(self, tipo, datos):
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT INTO cola (tipo, datos, creado) VALUES (?, ?, ?)",
+                (tipo, json.dumps(datos), now_str()),
+            )
+        self._wake.set()
+
+    def _pending(self):
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT seq, tipo, datos FROM cola ORDER BY seq").fetchall()
+        return rows
+
+    def _delete(self, seqs):
+        with closing(self._connect()) as conn, conn:
+            conn.executemany("DELETE FROM cola WHERE seq = ?", [(s,) for s in seqs])
+
+    def pending_count(self):
+        with closing(self._connect()) as conn:
+            return int(conn.execute("SELECT COUNT(*) FROM cola").fetchone()[0])
+
+    def flush(self):
+        # Envía todo lo pendiente. Si el envío falla, lo que no se guardó
+        # sigue en la cola y se reintenta en la siguiente vuelta; no se
+        # pierde ni se repite nada.
+        with self._lock:
+            rows = self._pending()
+            if not rows:
+                return 0
+            participantes, celdas, pagos = _coalesce(
+                (tipo, json.loads(datos)) for _, tipo, datos in rows
+            )
+
+            inicio = time.perf_counter()
+            if participantes:
+                # Todos en un solo envío y fuera de la cola en cuanto se
+                # guardan: si después falla otro paso, el reintento no los
+                # vuelve a agregar.
+                self.storage.add_participants(pd.DataFrame(participantes))
+                self._delete([seq for seq, tipo, _ in rows if tipo == "participante"])
+            for anio, cambios in celdas.items():
+                df_old = self.storage.load_calendar(anio)
+                self.storage.write_calendar(df_old, _apply_cells(df_old, cambios))
+            if pagos:
+                self.storage.write_payments(
+                    marcar=[k for k, v in pagos.items() if v],
+                    desmarcar=[k for k, v in pagos.items() if not v],
+                )
+            participants, calendar = self.storage.load_all()
+            summary = summarize(participants, calendar)
+            self.storage.write_summary(summary)
+            if self.on_flush is not None:
+                self.on_flush(participants, calendar, summary)
+
+            self._delete([seq for seq, tipo, _ in rows if tipo != "participante"])
+            self.last_flush = now_str()
+            self.last_error = None
+            logger.info(
+                "write_behind flush: %d cambios -> %d participantes, %d años, %d pagos (%.1f ms)",
+                len(rows), len(participantes), len(celdas), len(pagos),
+                (time.perf_counter() - inicio) * 1000,
+            )
+            return len(rows)
+
+    def _run(self):
+        while not self._stop.is_set():
+            # Espera el intervalo completo aunque llegue un cambio: así las
+            # ediciones seguidas se juntan en un solo envío.
+            self._wake.wait()
+            if self._stop.wait(self.flush_interval):
+                break
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as exc:
+                self.last_error = str(exc)
+                self._wake.set()
+                logger.exception("write_behind flush falló; se reintentará")
+
+    def close(self):
+        # Al cerrar el proceso se envía lo pendiente; lo que no se pueda
+        # enviar queda en el archivo para el próximo arranque.
+        self._stop.set()
+        self._wake.set()
+        self._worker.join(timeout=self.flush_interval + 1)
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("write_behind: quedaron cambios en %s", self.path)
+
+    # ---------------- lecturas (con lo pendiente aplicado) ----------------
+
+    def _overlay_calendar(self, df, year=None):
+        _, celdas, _ = _coalesce((tipo, json.loads(datos)) for _, tipo, datos in self._pending())
+        if year is not None:
+            celdas = {year: celdas.get(int(year), {})}
+        cambios = {cid: cols for por_anio in celdas.values() for cid, cols in por_anio.items()}
+        if not cambios:
+            return df
+        return normalize_calendar(_apply_cells(df, cambios))
+
+    def _overlay_payments(self, df):
+        _, _, pagos = _coalesce((tipo, json.loads(datos)) for _, tipo, datos in self._pending())
+        if not pagos:
+            return df
+        claves = list(zip(df["id_calendario"], df["id_participante"]))
+        df = df[pd.array([pagos.get(k, True) for k in claves], dtype=bool)]
+        existentes = set(claves)
+        nuevos = [k for k, v in pagos.items() if v and k not in existentes]
+        if nuevos:
+            fecha = now_str()
+            df = pd.concat(
+                [df, pd.DataFrame([(c, p, fecha) for c, p in nuevos], columns=df.columns)],
+                ignore_index=True,
+            )
+        return normalize_payments(df)
+
+    def load_participants(self):
+        return self.storage.load_participants()
+
+    def load_calendar(self, year=None):
+        return self._overlay_calendar(self.storage.load_calendar(year), year)
+
+    def load_all(self):
+        participants, calendar = self.storage.load_all()
+        return participants, self._overlay_calendar(calendar)
+
+    def max_calendar_id(self):
+        return self.storage.max_calendar_id()
+
+    def allocate_ids(self, sequence, count=1):
+        # Los ids se piden en el momento; no pasan por la cola.
+        return self.storage.allocate_ids(sequence, count)
+
+    def load_payments(self):
+        return self._overlay_payments(self.storage.load_payments())
+
+    # ---------------- escrituras ----------------
+
+    def add_participant(self, nombre, fecha_cumple, telefono, email, notas):
+        # El id se asigna al enviarse.
+        self._enqueue(
+            "participante",
+            {
+                "nombre": nombre,
+                "fecha_cumple": fecha_cumple,
+                "telefono": telefono,
+                "email": email,
+                "notas": notas,
+            },
+        )
+
+    def add_participants(self, df):
+        # Una importación ya va en un solo envío: se escribe en el momento,
+        # después de lo pendiente.
+        with self._lock:
+            self.flush()
+            return self.storage.add_participants(df)
+
+    def write_calendar(self, df_old, df_new):
+        d = diff_calendar(df_old, df_new)
+        if len(d["borrados"]) or len(d["nuevos"]):
+            # Cambia qué turnos existen: se escribe ya, después de lo
+            # pendiente, para que las filas de la hoja coincidan.
+            with self._lock:
+                self.flush()
+                self.storage.write_calendar(df_old, df_new)
+            return
+
+        changed = d["changed"]
+        celdas = [
+            (int(cid), int(d["old"].at[cid, "anio"]), col, d["new_vals"].at[cid, col])
+            for col in changed.columns
+            for cid in changed.index[changed[col]]
+        ]
+        if celdas:
+            self._enqueue("celdas", celdas)
+
+    def write_payments(self, marcar=(), desmarcar=()):
+        datos = [(int(c), int(p), True) for c, p in marcar]
+        datos += [(int(c), int(p), False) for c, p in desmarcar]
+        if datos:
+            self._enqueue("pagos", datos)
+
+    def load_summary(self):
+        return self.storage.load_summary()
+
+    def write_summary(self, summary):
+        self.storage.write_summary(summary)
+
+    def migrate_partitions(self):
+        return self.storage.migrate_partitions()
+
+    def rebuild_sequences(self):
+        return self.storage.rebuild_sequences()
+
+    def migrate_pagos_detalle(self):
+        with self._lock:
+            self.flush()
+            return self.storage.migrate_pagos_detalle()
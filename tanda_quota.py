@@ -0,0 +1,138 @@
+import logging
+import random
+import threading
+import time
+from collections import Counter, deque
+
+import requests
+from gspread.exceptions import APIError
+from gspread.http_client import HTTPClient
+
+from tanda_metrics import record_api_call
+
+logger = logging.getLogger("tanda")
+
+# ============================================================
+# CUOTA DE LA API DE SHEETS
+# ============================================================
+# Google limita las peticiones por minuto (60 por usuario por defecto). En
+# vez de recibir ráfagas de 429, cada petición pasa primero por un cubo de
+# fichas compartido por todo el proceso (todas las sesiones) y espera su
+# turno; si aun así llega un 429 o un error pasajero, se reintenta con
+# espera exponencial con jitter.
+
+# Errores pasajeros. 429 siempre se reintenta (Google no hizo nada); los
+# 5xx y 408 solo en peticiones que se pueden repetir sin duplicar filas.
+RETRY_CODES = {408, 429, 500, 502, 503, 504}
+
+class RequestBudget:
+    # Con `parent`, cada petición gasta una ficha propia y una del padre:
+    # así cada tanda tiene su límite sin pasar del total del proceso.
+
+    def __init__(self, per_minute=55, burst=10, parent=None):
+        self.parent = parent
+        self.per_minute = int(per_minute)
+        self.burst = max(1, int(burst))
+        self._rate = self.per_minute / 60.0
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._recent = deque()
+        self._lock = threading.Lock()
+        self._metrics = Counter()
+
+    def _wait_time(self, now):
+        # Segundos hasta poder gastar una ficha sin pasar del cubo ni del
+        # presupuesto de los últimos 60 s.
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+        while self._recent and now - self._recent[0] >= 60:
+            self._recent.popleft()
+
+        espera = 0.0
+        if self._tokens < 1:
+            espera = (1 - self._tokens) / self._rate
+        if len(self._recent) >= self.per_minute:
+            espera = max(espera, 60 - (now - self._recent[0]))
+        return espera
+
+    def acquire(self):
+        esperado = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                espera = self._wait_time(now)
+                if espera <= 0:
+                    self._tokens -= 1
+                    self._recent.append(now)
+                    self._metrics["requests"] += 1
+                    break
+            time.sleep(espera)
+            esperado += espera
+
+        if self.parent is not None:
+            esperado += self.parent.acquire()
+        if esperado:
+            self.record("throttled")
+            self.record("throttled_seconds", esperado)
+        return esperado
+
+    def record(self, key, amount=1):
+        with self._lock:
+            self._metrics[key] += amount
+
+    def metrics(self):
+        # requests, throttled (peticiones que esperaron), throttled_seconds,
+        # retries, backoff_seconds, errors_<código> y used_last_minute.
+        with self._lock:
+            now = time.monotonic()
+            usados = sum(1 for t in self._recent if now - t < 60)
+            return dict(self._metrics, used_last_minute=usados, per_minute=self.per_minute)
+
+class QuotaHTTPClient(HTTPClient):
+    # Cliente HTTP de gspread que pasa cada petición por un RequestBudget.
+    # Se usa con gspread.authorize(credenciales, http_client=partial(
+    # QuotaHTTPClient, budget=...)).
+
+    max_retries = 5
+    backoff_base = 1.0
+    backoff_cap = 32.0
+
+    def __init__(self, auth, session=None, budget=None):
+        super().__init__(auth, session)
+        self.budget = budget or RequestBudget()
+
+    def _can_retry(self, method, endpoint, code):
+        if code == 429:
+            return True
+        repetible = method.lower() in ("get", "put") or endpoint.endswith("values:batchUpdate")
+        return code in RETRY_CODES and repetible
+
+    def request(self, method, endpoint, *args, **kwargs):
+        intento = 0
+        while True:
+            self.budget.acquire()
+            inicio = time.perf_counter()
+            try:
+                response = super().request(method, endpoint, *args, **kwargs)
+                record_api_call(len(response.content or b""), time.perf_counter() - inicio)
+                return response
+            except APIError as exc:
+                record_api_call(0, time.perf_counter() - inicio)
+                self.budget.record(f"errors_{exc.code}")
+                if intento >= self.max_retries or not self._can_retry(method, endpoint, exc.code):
+                    raise
+            except requests.exceptions.Timeout:
+                self.budget.record("errors_timeout")
+                if intento >= self.max_retries or method.lower() != "get":
+                    raise
+
+            # Espera exponencial con jitter completo: las sesiones que
+            # fallaron juntas no vuelven a chocar en el mismo instante.
+            espera = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2**intento))
+            intento += 1
+            self.budget.record("retries")
+            self.budget.record("backoff_seconds", espera)
+            logger.warning(
+                "sheets %s %s: reintento %d en %.1f s", method.upper(), endpoint, intento, espera
+            )
+            time.sleep(espera)
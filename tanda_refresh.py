@@ -0,0 +1,164 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+
+import pandas as pd
+
+from tanda_loader import fetch_all
+from tanda_metrics import annotate
+from tanda_storage import ReadOnlyStorage, normalize_summary
+
+logger = logging.getLogger("tanda")
+
+# ============================================================
+# COPIA CALIENTE PARA EL DASHBOARD (STALE-WHILE-REVALIDATE)
+# ============================================================
+# El dashboard sirve participantes, calendario y resumen de una copia en
+# memoria del proceso. Un hilo la recarga cada `interval` segundos mientras
+# alguien la esté usando, o en cuanto se pide (la foto local cambió de
+# versión o llega el primer visitante tras un rato sin nadie). Mientras
+# recarga se sigue sirviendo la copia anterior; la nueva se cambia de una
+# sola vez cuando ya está leída y tipada. Solo la primera lectura de los
+# datos completos del proceso espera; mientras no hay copia, el resumen se
+# lee solo (una lectura pequeña) y la copia se pide en segundo plano.
+
+Copia = namedtuple("Copia", "generation participants calendar summary source_version loaded_at")
+
+class RefreshingStorage(ReadOnlyStorage):
+
+    def __init__(self, storage, interval=60.0, timeout=30.0):
+        self.storage = storage
+        self.interval = float(interval)
+        self.timeout = float(timeout)
+        self.last_duration_ms = None
+        self.last_error = None
+        self._copia = None
+        self._refresh_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._used = threading.Event()
+        self._worker = threading.Thread(target=self._run, name="tanda-refresh", daemon=True)
+        self._worker.start()
+
+    # ---------------- recarga ----------------
+
+    def refresh(self):
+        # Lee todo y cambia la copia. Si ya hay otra recarga en curso, se
+        # espera a que termine en vez de repetirla.
+        generacion = self._copia.generation if self._copia is not None else 0
+        with self._refresh_lock:
+            if self._copia is not None and self._copia.generation != generacion:
+                return self._copia
+            inicio = time.perf_counter()
+            version = self.storage.snapshot_version()
+            # Datos y resumen a la vez. Sin resumen el dashboard lo calcula,
+            # así que si falla se conserva el anterior.
+            previo = self._copia.summary if self._copia is not None else None
+            leidos = fetch_all(
+                {
+                    "datos": (self.storage.load_all, None),
+                    "resumen": (
+                        self.storage.load_summary,
+                        lambda: normalize_summary(pd.DataFrame()) if previo is None else previo,
+                    ),
+                },
+                timeout=self.timeout,
+            )
+            participants, calendar = leidos["datos"]
+            self._copia = Copia(
+                generacion + 1, participants, calendar, leidos["resumen"], version, time.time()
+            )
+            self.last_duration_ms = round((time.perf_counter() - inicio) * 1000, 1)
+            self.last_error = None
+        logger.info("refresh: generación %d en %.1f ms", generacion + 1, self.last_duration_ms)
+        return self._copia
+
+    def request_refresh(self):
+        self._used.set()
+        self._wake.set()
+
+    def _stale(self, copia):
+        return (
+            time.time() - copia.loaded_at >= self.interval
+            or self.storage.snapshot_version() != copia.source_version
+        )
+
+    def _run(self):
+        while True:
+            despertado = self._wake.wait(self.interval)
+            self._wake.clear()
+            # Sin visitas desde la última recarga no se gasta cuota; si lo
+            # despertaron, solo recarga si la copia sigue vieja (varias
+            # visitas pueden pedir la misma recarga).
+            copia = self._copia
+            if not self._used.is_set():
+                continue
+            if copia is not None and despertado and not self._stale(copia):
+                continue
+            self._used.clear()
+            try:
+                self.refresh()
+            except Exception as exc:
+                # Se sigue sirviendo la copia que hay; se reintenta en la
+                # siguiente vuelta.
+                self.last_error = str(exc)
+                logger.warning("refresh falló: %s", exc)
+
+    def stats(self):
+        # Edad de la copia y duración de la última recarga, para ajustar
+        # `interval`.
+        copia = self._copia
+        return {
+            "generation": copia.generation if copia else 0,
+            "age_s": round(time.time() - copia.loaded_at, 1) if copia else None,
+            "refresh_ms": self.last_duration_ms,
+            "interval_s": self.interval,
+            "error": self.last_error,
+        }
+
+    def _current(self):
+        copia = self._copia
+        if copia is None:
+            copia = self.refresh()
+        elif self._stale(copia):
+            # Vieja o con foto nueva: se sirve igual y se recarga aparte.
+            self.request_refresh()
+        self._used.set()
+        annotate("datos", self.stats())
+        return copia
+
+    # ---------------- lecturas ----------------
+
+    def snapshot_version(self):
+        # Cambia con cada copia nueva: es la llave de caché de las lecturas.
+        # No espera a que haya copia: sin ella es "copia-0" y se pide aparte.
+        copia = self._copia
+        if copia is None or self._stale(copia):
+            self.request_refresh()
+        else:
+            self._used.set()
+        return f"copia-{copia.generation if copia is not None else 0}"
+
+    def load_participants(self):
+        return self._current().participants
+
+    def load_calendar(self, year=None):
+        df = self._current().calendar
+        return df if year is None else df[df["anio"] == year]
+
+    def load_all(self):
+        copia = self._current()
+        return copia.participants, copia.calendar
+
+    def load_summary(self):
+        if self._copia is None:
+            # Sin copia todavía: solo el resumen, sin esperar lo demás.
+            self.request_refresh()
+            return self.storage.load_summary()
+        return self._current().summary
+
+    def load_payments(self):
+        return self.storage.load_payments()
+
+    def max_calendar_id(self):
+        return self.storage.max_calendar_id()
@@ -0,0 +1,41 @@
+from bisect import bisect_left
+
+import numpy as np
+
+# ============================================================
+# PRÓXIMOS EN RECIBIR
+# ============================================================
+# Todos los turnos con fecha, de todos los años, ordenados por
+# (fecha_pago, id). Buscar "a partir de hoy" es una búsqueda binaria, así
+# que en diciembre el siguiente es el de enero del año que sigue (si ya está
+# generado) y no el último que ya pasó.
+
+def _days(fechas):
+    # Fechas como días desde 1970-01-01, para comparar enteros.
+    return fechas.to_numpy().astype("datetime64[D]").astype(np.int64)
+
+class UpcomingIndex:
+
+    def __init__(self, calendar):
+        validos = calendar[calendar["fecha_pago"].notna()]
+        self.turnos = validos.sort_values(["fecha_pago", "id"], kind="stable").reset_index(drop=True)
+        self._dias = _days(self.turnos["fecha_pago"]).tolist()
+
+    def _position(self, hoy):
+        dia = int(np.datetime64(hoy, "D").astype(np.int64))
+        return bisect_left(self._dias, dia)
+
+    def upcoming(self, hoy, n=1):
+        # Los siguientes n turnos con fecha_pago >= hoy, en orden.
+        i = self._position(hoy)
+        return self.turnos.iloc[i : i + n]
+
+    def next_or_last(self, hoy):
+        # (turno, es_futuro): el próximo a partir de hoy o, si ya no quedan,
+        # el último que pasó. None si ningún turno tiene fecha.
+        i = self._position(hoy)
+        if i < len(self.turnos):
+            return self.turnos.iloc[i], True
+        if i > 0:
+            return self.turnos.iloc[i - 1], False
+        return None
@@ -0,0 +1,160 @@
+import logging
+import os
+import re
+import shutil
+from datetime import datetime
+
+import pyarrow as pa
+
+from tanda_storage import ReadOnlyStorage
+
+logger = logging.getLogger("tanda")
+
+# ============================================================
+# FOTO LOCAL DE LOS DATOS (ARROW)
+# ============================================================
+# El admin publica, después de cada escritura, una copia de participantes,
+# calendario y resumen en archivos Arrow IPC en disco local:
+#
+#   <dir>/<version>/participantes.arrow
+#   <dir>/<version>/calendario.arrow
+#   <dir>/<version>/resumen.arrow
+#   <dir>/ULTIMA        <- nombre de la versión más reciente
+#
+# Cada versión se escribe completa en su carpeta y después se cambia ULTIMA
+# con os.replace, así que un lector nunca ve una versión a medias. El
+# dashboard abre los archivos con memory map (las columnas numéricas y de
+# fechas se leen sin copiar) y solo va a Sheets si todavía no hay foto.
+
+ARCHIVOS = {
+    "participants": "participantes.arrow",
+    "calendar": "calendario.arrow",
+    "summary": "resumen.arrow",
+}
+LATEST = "ULTIMA"
+
+# Versiones que se conservan: un dashboard puede estar leyendo una anterior.
+KEEP_VERSIONS = 3
+
+# Nombre de una versión (ver publish). Solo esas carpetas se borran: en la
+# misma carpeta puede haber otras (p. ej. las de otras tandas).
+VERSION_RE = re.compile(r"^\d{8}-\d{6}-\d{6}$")
+
+def _to_table(df):
+    # Las columnas de texto pueden traer números sueltos (Sheets devuelve
+    # celdas sin formato); Arrow necesita un solo tipo por columna.
+    texto = [c for c in df.columns if df[c].dtype == object]
+    df = df.astype({c: str for c in texto})
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+class SnapshotStore:
+
+    def __init__(self, path):
+        self.path = path
+
+    def latest(self):
+        # Versión más reciente, o None si aún no se ha publicado nada.
+        try:
+            with open(os.path.join(self.path, LATEST), encoding="utf-8") as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return version if os.path.isdir(os.path.join(self.path, version)) else None
+
+    def publish(self, participants, calendar, summary):
+        version = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        carpeta = os.path.join(self.path, version)
+        os.makedirs(carpeta, exist_ok=True)
+        for nombre, df in (
+            ("participants", participants), ("calendar", calendar), ("summary", summary)
+        ):
+            tabla = _to_table(df)
+            with pa.OSFile(os.path.join(carpeta, ARCHIVOS[nombre]), "wb") as sink:
+                with pa.ipc.new_file(sink, tabla.schema) as writer:
+                    writer.write_table(tabla)
+
+        temporal = os.path.join(self.path, f"{LATEST}.tmp")
+        with open(temporal, "w", encoding="utf-8") as f:
+            f.write(version)
+        os.replace(temporal, os.path.join(self.path, LATEST))
+        self._prune(version)
+        return version
+
+    def _prune(self, actual):
+        versiones = sorted(
+            d for d in os.listdir(self.path)
+            if VERSION_RE.match(d) and os.path.isdir(os.path.join(self.path, d)) and d <= actual
+        )
+        for viejo in versiones[:-KEEP_VERSIONS]:
+            shutil.rmtree(os.path.join(self.path, viejo), ignore_errors=True)
+
+    def read(self, version, nombre):
+        # Tabla mapeada en memoria -> DataFrame con los mismos tipos que los
+        # loaders (fechas datetime64, estatus categórico, ids int32).
+        ruta = os.path.join(self.path, version, ARCHIVOS[nombre])
+        with pa.memory_map(ruta, "r") as fuente:
+            tabla = pa.ipc.open_file(fuente).read_all()
+        df = tabla.to_pandas(split_blocks=True)
+        # El texto vuelve como object, igual que en los loaders.
+        texto = [
+            f.name for f in tabla.schema
+            if pa.types.is_string(f.type) or pa.types.is_large_string(f.type)
+        ]
+        return df.astype({c: object for c in texto})
+
+class SnapshotStorage(ReadOnlyStorage):
+    # Lecturas desde la foto local; sin foto, desde el almacenamiento real,
+    # que se abre solo si hace falta (`open_fallback` lo construye).
+
+    def __init__(self, store, open_fallback):
+        self.store = store
+        self._open_fallback = open_fallback
+        self._fallback = None
+
+    @property
+    def fallback(self):
+        if self._fallback is None:
+            self._fallback = self._open_fallback()
+        return self._fallback
+
+    def snapshot_version(self):
+        return self.store.latest()
+
+    def _read(self, nombre, version=None):
+        version = version or self.store.latest()
+        if version is None:
+            return None
+        try:
+            return self.store.read(version, nombre)
+        except (OSError, pa.ArrowInvalid) as exc:
+            logger.warning("snapshot %s/%s ilegible: %s", version, nombre, exc)
+            return None
+
+    def load_participants(self):
+        df = self._read("participants")
+        return self.fallback.load_participants() if df is None else df
+
+    def load_calendar(self, year=None):
+        df = self._read("calendar")
+        if df is None:
+            return self.fallback.load_calendar(year)
+        return df if year is None else df[df["anio"] == year]
+
+    def load_all(self):
+        # Ambos de la misma versión.
+        version = self.store.latest()
+        participants = self._read("participants", version)
+        calendar = self._read("calendar", version)
+        if participants is None or calendar is None:
+            return self.fallback.load_all()
+        return participants, calendar
+
+    def load_summary(self):
+        df = self._read("summary")
+        return self.fallback.load_summary() if df is None else df
+
+    def load_payments(self):
+        return self.fallback.load_payments()
+
+    def max_calendar_id(self):
+        return self.fallback.max_calendar_id()
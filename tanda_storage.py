@@ -0,0 +1,1148 @@
+import functools
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import closing
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import requests
+from google.auth.exceptions import TransportError
+from gspread.exceptions import APIError, WorksheetNotFound
+from gspread.utils import absolute_range_name, rowcol_to_a1
+from gspread_dataframe import set_with_dataframe
+
+from tanda_schedule import UpcomingIndex
+
+# ============================================================
+# ESQUEMA
+# ============================================================
+
+COLS_PARTICIPANTES = ["id", "nombre", "fecha_cumple", "telefono", "email", "notas"]
+COLS_CALENDARIO = [
+    "id",
+    "anio",
+    "id_participante",
+    "nombre_participante",
+    "fecha_pago",
+    "monto_por_persona",
+    "total_a_recibir",
+    "estatus",
+    "fecha_pago_real",
+    "notas",
+    "pagos_detalle",
+]
+# Un registro por aporte: quién pagó qué turno y cuándo se registró.
+# Reemplaza a la columna de texto `pagos_detalle` del calendario, que solo
+# se conserva vacía por compatibilidad y se migra automáticamente.
+COLS_PAGOS = ["id_calendario", "id_participante", "fecha_registro"]
+
+def ensure_columns(df, columns):
+    for c in columns:
+        if c not in df.columns:
+            df[c] = ""
+    return df[columns]
+
+ESTATUS = ["Pendiente", "Completado"]
+
+def parse_dates(fechas):
+    # Formato de la hoja (YYYY-MM-DD) en una sola pasada; lo que no encaje
+    # se intenta con el parser general de pandas, uno por uno.
+    fechas = fechas.astype(str)
+    dt = pd.to_datetime(fechas, format="%Y-%m-%d", errors="coerce")
+    bad = dt.isna() & ~fechas.str.strip().isin(["", "NaT", "nan", "None"])
+    if bad.any():
+        dt[bad] = fechas[bad].map(lambda x: pd.to_datetime(x, errors="coerce"))
+    return pd.to_datetime(dt, errors="coerce")
+
+# Los loaders devuelven frames ya tipados, para no convertir en cada
+# pantalla: ids int32, fechas de pago datetime64, montos float64 y
+# estatus categórico. El calendario viene ordenado por año, fecha e id.
+# El índice se conserva (los escritores de Sheets lo usan como fila).
+
+def normalize_participants(df):
+    df = df.dropna(how="all")
+    df = ensure_columns(df.fillna(""), COLS_PARTICIPANTES)
+    df["id"] = pd.to_numeric(df["id"], errors="coerce").fillna(0).astype("int32")
+    return df
+
+def normalize_calendar(df):
+    df = df.dropna(how="all")
+    df = ensure_columns(df.fillna(""), COLS_CALENDARIO)
+    for c in ["id", "id_participante"]:
+        df[c] = pd.to_numeric(df[c], errors="coerce").fillna(0).astype("int32")
+    df["anio"] = pd.to_numeric(df["anio"], errors="coerce").fillna(
+        datetime.today().year
+    ).astype("int32")
+    df["fecha_pago"] = parse_dates(df["fecha_pago"])
+    for c in ["monto_por_persona", "total_a_recibir"]:
+        df[c] = pd.to_numeric(df[c], errors="coerce").fillna(0.0).astype("float64")
+    estatus = df["estatus"].astype(str)
+    otros = sorted(set(estatus) - set(ESTATUS))
+    df["estatus"] = pd.Categorical(estatus, categories=ESTATUS + otros)
+    return df.sort_values(["anio", "fecha_pago", "id"], kind="stable")
+
+def calendar_year(df, year):
+    # Vista de un año. Es de solo lectura para las secciones que la usan.
+    return df[df["anio"] == year]
+
+def normalize_payments(df):
+    df = df.dropna(how="all")
+    if df.empty:
+        return pd.DataFrame(columns=COLS_PAGOS).astype(
+            {"id_calendario": "int64", "id_participante": "int64"}
+        )
+    df = ensure_columns(df.fillna(""), COLS_PAGOS)
+    for c in ["id_calendario", "id_participante"]:
+        df[c] = pd.to_numeric(df[c], errors="coerce").fillna(0).astype("int64")
+    return df
+
+def now_str():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def cell_value(v):
+    # Representación común para comparar lo leído con lo editado:
+    # vacíos como "", números enteros sin ".0", fechas como YYYY-MM-DD.
+    if isinstance(v, str):
+        return v
+    if v is None or pd.isna(v):
+        return ""
+    if isinstance(v, datetime):
+        return v.strftime("%Y-%m-%d")
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        f = float(v)
+        return str(int(f)) if f.is_integer() else str(f)
+    return str(v)
+
+def frame_values(df):
+    # Celdas como texto listo para escribir/comparar (ver cell_value).
+    return df.astype(object).apply(lambda c: c.map(cell_value))
+
+def diff_calendar(df_old, df_new):
+    # Compara por id. Devuelve las filas nuevas/viejas indexadas por id, la
+    # matriz de celdas cambiadas (solo filas comunes, valores ya
+    # normalizados) y los ids borrados y agregados.
+    df_new = ensure_columns(df_new.copy(), COLS_CALENDARIO)
+    old = df_old.set_index("id")
+    new = df_new.drop_duplicates("id", keep="last").set_index("id")
+
+    comunes = new.index.intersection(old.index)
+    cols = COLS_CALENDARIO[1:]
+    old_vals = frame_values(old.loc[comunes, cols])
+    new_vals = frame_values(new.loc[comunes, cols])
+    changed = old_vals.ne(new_vals)
+
+    return {
+        "old": old,
+        "new": new,
+        "new_vals": new_vals,
+        "changed": changed,
+        "borrados": old.index.difference(new.index),
+        "nuevos": new.index.difference(old.index),
+    }
+
+# Columnas del calendario que el admin edita a mano.
+CAMPOS_EDITABLES = ["estatus", "fecha_pago_real", "notas"]
+
+def merge_calendar_edits(df, ediciones):
+    # ediciones: {id: {col: valor}} con columnas de CAMPOS_EDITABLES (lo que
+    # reporta el editor, solo las celdas tocadas). Las aplica por id de una
+    # vez y devuelve (filas_viejas, filas_nuevas) solo de los turnos en los
+    # que algún valor quedó distinto.
+    ids = [int(i) for i in ediciones]
+    cols = [c for c in CAMPOS_EDITABLES if any(c in e for e in ediciones.values())]
+    old = df[df["id"].isin(ids)]
+    if old.empty or not cols:
+        return old.iloc[0:0], old.iloc[0:0]
+
+    valores = pd.DataFrame(
+        [[e.get(c) for c in cols] for e in ediciones.values()], index=ids, columns=cols
+    )
+    tocadas = pd.DataFrame(
+        [[c in e for c in cols] for e in ediciones.values()], index=ids, columns=cols
+    )
+    pos = old["id"].to_numpy()
+    tocadas = tocadas.reindex(pos).fillna(False).to_numpy(dtype=bool)
+
+    new = old.astype({c: object for c in cols})
+    new[cols] = np.where(tocadas, valores.reindex(pos).to_numpy(object), new[cols].to_numpy(object))
+
+    distinto = frame_values(old[cols]).ne(frame_values(new[cols])).any(axis=1)
+    return old[distinto], new[distinto]
+
+def parse_pagos(raw):
+    pagados = set()
+    for x in str(raw).split(","):
+        x = x.strip()
+        if x.isdigit():
+            pagados.add(int(x))
+    return pagados
+
+# ============================================================
+# RESUMEN
+# ============================================================
+# Lo que muestra la parte de arriba del dashboard, una fila por año: así se
+# dibuja con una lectura mínima y los datos completos solo se piden para las
+# secciones de abajo. El admin lo recalcula en cada escritura.
+#
+# El próximo en recibir (de cualquier año) depende de la fecha: se guarda el
+# calculado el día `calculado`. Sigue siendo válido mientras su fecha no
+# haya pasado (entre ambos días no hay otro turno); si no había turnos
+# futuros, tampoco los hay después (generar un año recalcula el resumen).
+
+COLS_RESUMEN = [
+    "anio",
+    "participantes",
+    "turnos",
+    "monto_por_persona",
+    "total_a_recibir",
+    "completados",
+    "pendientes",
+    "calculado",
+    "proximo_id",
+    "proximo_nombre",
+    "proximo_nickname",
+    "proximo_fecha",
+    "proximo_total",
+    "proximo_estatus",
+    "proximo_futuro",
+]
+
+def summarize(participants, calendar, hoy=None, index=None):
+    # index: UpcomingIndex de `calendar` ya armado (tanda_db guarda uno por
+    # versión y día); sin él se arma aquí.
+    hoy = pd.Timestamp(hoy if hoy is not None else datetime.today().date())
+    notas = participants.set_index("id")["notas"].astype(str).str.strip()
+    notas = notas[~notas.index.duplicated()]
+
+    # El próximo en recibir es uno solo para todos los años (ver
+    # tanda_schedule); se repite en cada fila.
+    if index is None:
+        index = UpcomingIndex(calendar)
+    proximo = index.next_or_last(hoy)
+    if proximo is None and not calendar.empty:
+        proximo = calendar.iloc[-1], False
+
+    campos_proximo = {}
+    if proximo is not None:
+        nr, futuro = proximo
+        nickname = str(notas.get(int(nr["id_participante"]), "")).strip()
+        if nickname == "":
+            nickname = str(nr["notas"]).strip()
+        if nickname == "":
+            nickname = nr["nombre_participante"]
+        campos_proximo = {
+            "proximo_id": int(nr["id"]),
+            "proximo_nombre": nr["nombre_participante"],
+            "proximo_nickname": nickname,
+            "proximo_fecha": nr["fecha_pago"],
+            "proximo_total": float(nr["total_a_recibir"]),
+            "proximo_estatus": str(nr["estatus"]),
+            "proximo_futuro": int(futuro),
+        }
+
+    filas = []
+    for anio, df_y in calendar.groupby("anio", sort=True):
+        filas.append(
+            {
+                "anio": int(anio),
+                "participantes": len(participants),
+                "turnos": len(df_y),
+                "monto_por_persona": float(df_y["monto_por_persona"].iloc[0]),
+                "total_a_recibir": float(df_y["total_a_recibir"].iloc[0]),
+                "completados": int((df_y["estatus"] == "Completado").sum()),
+                "pendientes": int((df_y["estatus"] == "Pendiente").sum()),
+                "calculado": hoy,
+                **campos_proximo,
+            }
+        )
+    return normalize_summary(pd.DataFrame(filas, columns=COLS_RESUMEN))
+
+def normalize_summary(df):
+    df = df.dropna(how="all")
+    df = ensure_columns(df.fillna(""), COLS_RESUMEN)
+    for c in ["anio", "participantes", "turnos", "completados", "pendientes",
+              "proximo_id", "proximo_futuro"]:
+        df[c] = pd.to_numeric(df[c], errors="coerce").fillna(0).astype("int64")
+    for c in ["monto_por_persona", "total_a_recibir", "proximo_total"]:
+        df[c] = pd.to_numeric(df[c], errors="coerce").fillna(0.0).astype("float64")
+    for c in ["calculado", "proximo_fecha"]:
+        df[c] = parse_dates(df[c])
+    return df[df["anio"] > 0].sort_values("anio")
+
+def current_summary(summary, hoy=None):
+    # Fila del año más reciente como dict, o None si no hay resumen o su
+    # próximo en recibir ya pasó (hay que recalcularlo con los datos).
+    if summary.empty:
+        return None
+    hoy = pd.Timestamp(hoy if hoy is not None else datetime.today().date())
+    fila = summary.iloc[-1].to_dict()
+    if fila["calculado"] > hoy:
+        return None
+    if fila["proximo_futuro"] and fila["proximo_fecha"] < hoy:
+        return None
+    return fila
+
+# ============================================================
+# INTERFAZ
+# ============================================================
+
+class TandaStorage(ABC):
+    # Operaciones que usan las apps. Los DataFrames siempre siguen
+    # COLS_PARTICIPANTES / COLS_CALENDARIO. Los métodos abstractos son los
+    # que cada backend debe implementar (si falta uno, falla al crearlo);
+    # los demás tienen una versión general que el backend puede mejorar.
+
+    # Tanda a la que pertenece (ver tanda_db); forma parte de las llaves de
+    # caché cuando un despliegue sirve varias.
+    tanda = "default"
+
+    @abstractmethod
+    def load_participants(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_participant(self, nombre, fecha_cumple, telefono, email, notas):
+        raise NotImplementedError
+
+    def add_participants(self, df):
+        # Alta en bloque: df con las columnas de COLS_PARTICIPANTES salvo
+        # "id". Devuelve los ids asignados, consecutivos y en orden.
+        return [self.add_participant(**fila) for fila in df.to_dict("records")]
+
+    def _participant_rows(self, df, primero):
+        # Filas como las de add_participant: el id como número, lo demás texto.
+        df = ensure_columns(df.copy(), COLS_PARTICIPANTES)
+        valores = frame_values(df[COLS_PARTICIPANTES[1:]]).values.tolist()
+        return [[primero + i] + fila for i, fila in enumerate(valores)]
+
+    @abstractmethod
+    def load_calendar(self, year=None):
+        raise NotImplementedError
+
+    def load_all(self):
+        # (participantes, calendario) de una vez; los backends que pueden
+        # traer ambos en una sola consulta lo sobrescriben.
+        return self.load_participants(), self.load_calendar()
+
+    def snapshot_version(self):
+        # Versión de la copia de los datos que sirve el backend (foto local
+        # o copia en memoria); None si lee directo de la fuente.
+        return None
+
+    def max_calendar_id(self):
+        df = self.load_calendar()
+        return 0 if df.empty else int(df["id"].max())
+
+    def max_id(self, sequence):
+        # El id más alto que ya está en los datos de `sequence`.
+        if sequence == "participantes":
+            df = self.load_participants()
+            return 0 if df.empty else int(df["id"].max())
+        if sequence == "calendario":
+            return self.max_calendar_id()
+        raise ValueError(f"Secuencia desconocida: {sequence}")
+
+    def allocate_ids(self, sequence, count=1):
+        # Reserva `count` ids consecutivos de `sequence` ("participantes" o
+        # "calendario") y devuelve el primero. Sin un contador guardado se
+        # calcula con los datos (y no reserva nada).
+        return self.max_id(sequence) + 1
+
+    def rebuild_sequences(self):
+        # Pone los contadores al menos en el id más alto de los datos.
+        return {}
+
+    def migrate_partitions(self):
+        # Solo aplica a backends con el calendario en una hoja única.
+        return 0
+
+    @abstractmethod
+    def write_calendar(self, df_old, df_new):
+        # df_old debe ser el resultado de load_calendar(), de todos los años
+        # o de uno solo; solo se escriben las filas de ese alcance. También
+        # puede ser un subconjunto de esas filas si df_new tiene los mismos
+        # ids (solo cambian celdas, p. ej. merge_calendar_edits).
+        raise NotImplementedError
+
+    def replace_calendar_year(self, df_new_year, year):
+        df_old = self.load_calendar(year)
+        self.write_calendar(df_old, df_new_year)
+
+        # Los turnos reemplazados se llevan sus pagos.
+        borrados = set(df_old["id"]) - set(df_new_year["id"])
+        if borrados:
+            self.drop_payments(borrados)
+
+    # ---------------- pagos ----------------
+
+    @abstractmethod
+    def load_payments(self):
+        # DataFrame con COLS_PAGOS (ids enteros).
+        raise NotImplementedError
+
+    @abstractmethod
+    def write_payments(self, marcar=(), desmarcar=()):
+        # marcar / desmarcar: pares (id_calendario, id_participante).
+        # Marcar algo ya marcado o desmarcar algo inexistente no hace nada.
+        raise NotImplementedError
+
+    def drop_payments(self, calendar_ids):
+        pagos = self.load_payments()
+        quitar = pagos[pagos["id_calendario"].isin(list(calendar_ids))]
+        self.write_payments(
+            desmarcar=list(zip(quitar["id_calendario"], quitar["id_participante"]))
+        )
+
+    # ---------------- resumen ----------------
+
+    @abstractmethod
+    def load_summary(self):
+        # DataFrame con COLS_RESUMEN (vacío si aún no se ha calculado).
+        raise NotImplementedError
+
+    @abstractmethod
+    def write_summary(self, summary):
+        raise NotImplementedError
+
+    def refresh_summary(self):
+        participants, calendar = self.load_all()
+        self.write_summary(summarize(participants, calendar))
+
+    def save_payment_changes(self, marcar=(), desmarcar=(), completed=(), year=None):
+        # Todas las marcas cambiadas en una sola escritura y, si hay turnos
+        # completos, su estatus en una sola escritura del año.
+        self.write_payments(marcar=marcar, desmarcar=desmarcar)
+        if len(completed):
+            df_old = self.load_calendar(year)
+            df_new = df_old.copy()
+            df_new.loc[df_new["id"].isin(list(completed)), "estatus"] = "Completado"
+            self.write_calendar(df_old, df_new)
+
+    def migrate_pagos_detalle(self):
+        # Pasa la columna de texto `pagos_detalle` al registro de pagos y la
+        # deja vacía. Es idempotente: sin texto pendiente no hace nada.
+        df_old = self.load_calendar()
+        if df_old.empty:
+            return 0
+        con_texto_mask = df_old["pagos_detalle"].astype(str).str.strip() != ""
+        con_texto = df_old[con_texto_mask]
+        if con_texto.empty:
+            return 0
+
+        marcar = [
+            (int(cid), pid)
+            for cid, raw in zip(con_texto["id"], con_texto["pagos_detalle"])
+            for pid in sorted(parse_pagos(raw))
+        ]
+        self.write_payments(marcar=marcar)
+
+        df_new = df_old.copy()
+        df_new.loc[con_texto_mask, "pagos_detalle"] = ""
+        self.write_calendar(df_old, df_new)
+        return len(marcar)
+
+class ReadOnlyStorage(TandaStorage):
+    # Base de los envoltorios de solo lectura del dashboard (foto local,
+    # copia en memoria): las escrituras fallan con un error claro.
+
+    def _solo_lectura(self, *args, **kwargs):
+        raise PermissionError(f"{type(self).__name__} es de solo lectura.")
+
+    add_participant = _solo_lectura
+    write_calendar = _solo_lectura
+    write_payments = _solo_lectura
+    write_summary = _solo_lectura
+
+# ============================================================
+# GOOGLE SHEETS
+# ============================================================
+
+# Igual que get_as_dataframe(evaluate_formulas=True): valores ya calculados
+# y fechas como texto.
+VALUE_RENDER = {
+    "valueRenderOption": "UNFORMATTED_VALUE",
+    "dateTimeRenderOption": "FORMATTED_STRING",
+}
+
+def values_to_frame(values):
+    # La primera fila es el encabezado; el índice queda como fila de la
+    # hoja - 2, que es lo que usan los escritores por diferencias.
+    if not values:
+        return pd.DataFrame()
+    header = [str(c) for c in values[0]]
+    width = len(header)
+    rows = [list(r[:width]) + [None] * (width - len(r)) for r in values[1:]]
+    df = pd.DataFrame(rows, columns=header, dtype=object)
+    return df.mask(df.eq(""))
+
+def _is_disconnect(exc):
+    # Conexión caída o token rechazado (401). La sesión de gspread ya
+    # refresca el token antes de que expire; esto cubre lo que queda.
+    if isinstance(exc, APIError):
+        return exc.code == 401
+    return isinstance(exc, (requests.exceptions.ConnectionError, TransportError))
+
+def _reconnecting(retry):
+    # Si la conexión se cae, vuelve a abrir el spreadsheet. Las lecturas se
+    # reintentan una vez; las escrituras no (un append repetido duplicaría
+    # filas), solo dejan la conexión lista para el siguiente intento.
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            try:
+                return method(self, *args, **kwargs)
+            except Exception as exc:
+                if self._reconnect is None or not _is_disconnect(exc):
+                    raise
+                self.reconnect()
+                if not retry:
+                    raise
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+# Calendario particionado por año: una hoja "calendario_<anio>" por año y un
+# índice pequeño "calendario_anios" con los años que existen y el id más alto
+# de cada uno. Guardar un año solo toca su hoja. Las hojas antiguas con todo
+# en "calendario" se siguen leyendo hasta que migrate_partitions() las
+# reparte (el admin lo hace al abrir; la hoja vieja queda como respaldo).
+CALENDAR_INDEX = "calendario_anios"
+COLS_INDICE = ["anio", "hoja", "max_id"]
+LEGACY_CALENDAR = "calendario"
+SUMMARY_SHEET = "resumen"
+
+# Contadores de ids: una fila por secuencia con el último id entregado. Dar
+# un id nuevo es leer y escribir esa fila, sin descargar los datos. Si la
+# fila no existe (o alguien la borró) se reconstruye con el id más alto de
+# los datos.
+SEQUENCE_SHEET = "secuencias"
+COLS_SECUENCIAS = ["secuencia", "ultimo"]
+SEQUENCES = ["participantes", "calendario"]
+
+# Todas las sesiones de Streamlit comparten el proceso: el candado hace que
+# la lectura y escritura del contador no se intercalen entre ellas.
+_sequence_lock = threading.Lock()
+
+def partition_title(year):
+    return f"calendario_{int(year)}"
+
+def normalize_index(df):
+    df = df.dropna(how="all")
+    df = ensure_columns(df.fillna(""), COLS_INDICE)
+    for c in ["anio", "max_id"]:
+        df[c] = pd.to_numeric(df[c], errors="coerce").fillna(0).astype("int64")
+    df["hoja"] = df["hoja"].astype(str)
+    return df[df["anio"] > 0].sort_values("anio")
+
+def normalize_sequences(df):
+    # Conserva el índice (fila de la hoja - 2) para reescribir en su lugar.
+    df = ensure_columns(df.fillna(""), COLS_SECUENCIAS)
+    df["secuencia"] = df["secuencia"].astype(str).str.strip()
+    df["ultimo"] = pd.to_numeric(df["ultimo"], errors="coerce")
+    return df
+
+class SheetsStorage(TandaStorage):
+
+    def __init__(self, spreadsheet, reconnect=None):
+        # `reconnect` (opcional) devuelve un spreadsheet recién abierto.
+        self._reconnect = reconnect
+        self._bind(spreadsheet)
+
+    def _bind(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+        self._refresh_sheets()
+        self.sheet_participantes = self._sheets.get("participantes")
+        if self.sheet_participantes is None:
+            raise WorksheetNotFound("participantes")
+
+    def _refresh_sheets(self):
+        # Una sola consulta de metadatos para todas las hojas.
+        self._sheets = {ws.title: ws for ws in self.spreadsheet.worksheets()}
+
+    def _sheet(self, title, header=None):
+        # Si la hoja no está en la lista se vuelve a consultar (otro proceso
+        # pudo crearla); con `header` se crea cuando no existe.
+        if title not in self._sheets:
+            self._refresh_sheets()
+        if title not in self._sheets and header is not None:
+            ws = self.spreadsheet.add_worksheet(title, rows=1000, cols=len(header))
+            ws.append_row(header)
+            self._sheets[title] = ws
+        return self._sheets.get(title)
+
+    @property
+    def partitioned(self):
+        return CALENDAR_INDEX in self._sheets
+
+    def _legacy_layout(self):
+        # True si el calendario sigue en la hoja única. Se usa la lista de
+        # hojas que ya se tiene; solo se vuelve a consultar si falta la hoja
+        # vieja (otro proceso pudo migrarla). Si la migran entre la consulta
+        # y la lectura, la lectura falla y se vuelve a intentar con las
+        # particiones (ver load_calendar / load_all).
+        if self.partitioned:
+            return False
+        if LEGACY_CALENDAR not in self._sheets:
+            self._refresh_sheets()
+        return not self.partitioned
+
+    def _migrated_meanwhile(self):
+        self._refresh_sheets()
+        return self.partitioned
+
+    def _pagos_sheet(self, create=False):
+        # La hoja "pagos" se crea la primera vez que se escribe un aporte.
+        return self._sheet("pagos", header=COLS_PAGOS if create else None)
+
+    def _delete_rows(self, ws, filas):
+        # Un solo batchUpdate; de abajo hacia arriba para no mover índices y
+        # juntando filas contiguas en un mismo rango.
+        requests = []
+        for fila in sorted(set(filas), reverse=True):
+            if requests and requests[-1]["deleteDimension"]["range"]["startIndex"] == fila:
+                requests[-1]["deleteDimension"]["range"]["startIndex"] = fila - 1
+            else:
+                requests.append(
+                    {
+                        "deleteDimension": {
+                            "range": {
+                                "sheetId": ws.id,
+                                "dimension": "ROWS",
+                                "startIndex": fila - 1,
+                                "endIndex": fila,
+                            }
+                        }
+                    }
+                )
+        if requests:
+            self.spreadsheet.batch_update({"requests": requests})
+
+    def reconnect(self):
+        self._bind(self._reconnect())
+
+    def _get_values(self, ws):
+        data = self.spreadsheet.values_get(absolute_range_name(ws.title), params=VALUE_RENDER)
+        return data.get("values", [])
+
+    def _batch_values(self, titles):
+        if not titles:
+            return []
+        data = self.spreadsheet.values_batch_get(
+            [absolute_range_name(t) for t in titles], params=VALUE_RENDER
+        )
+        rangos = [r.get("values", []) for r in data.get("valueRanges", [])]
+        return rangos + [[]] * (len(titles) - len(rangos))
+
+    def _calendar_from_partitions(self, rangos):
+        # Cada partición conserva su índice (fila de su hoja - 2); los
+        # escritores siempre separan por año antes de usarlo.
+        frames = [values_to_frame(v) for v in rangos if v]
+        if not frames:
+            return normalize_calendar(pd.DataFrame())
+        return normalize_calendar(pd.concat(frames))
+
+    def _read_index(self):
+        ws = self._sheets.get(CALENDAR_INDEX)
+        if ws is None:
+            return normalize_index(pd.DataFrame())
+        return normalize_index(values_to_frame(self._get_values(ws)))
+
+    def _known_partitions(self):
+        return [
+            t for t in self._sheets
+            if t.startswith("calendario_") and t[len("calendario_"):].isdigit()
+        ]
+
+    def _load_legacy_calendar(self):
+        ws = self._sheets.get(LEGACY_CALENDAR)
+        if ws is None:
+            return normalize_calendar(pd.DataFrame())
+        return normalize_calendar(values_to_frame(self._get_values(ws)))
+
+    @_reconnecting(retry=True)
+    def load_participants(self):
+        return normalize_participants(values_to_frame(self._get_values(self.sheet_participantes)))
+
+    @_reconnecting(retry=False)
+    def add_participant(self, nombre, fecha_cumple, telefono, email, notas):
+        new_id = self.allocate_ids("participantes")
+        self.sheet_participantes.append_row(
+            [new_id, nombre, fecha_cumple, telefono, email, notas]
+        )
+        return new_id
+
+    @_reconnecting(retry=False)
+    def add_participants(self, df):
+        # Un bloque de ids y un solo append_rows para todo el archivo.
+        if df.empty:
+            return []
+        primero = self.allocate_ids("participantes", len(df))
+        self.sheet_participantes.append_rows(self._participant_rows(df, primero))
+        return list(range(primero, primero + len(df)))
+
+    @_reconnecting(retry=True)
+    def load_calendar(self, year=None):
+        if self._legacy_layout():
+            try:
+                df = self._load_legacy_calendar()
+                return df if year is None else df[df["anio"] == year]
+            except APIError:
+                if not self._migrated_meanwhile():
+                    raise
+
+        if year is not None:
+            ws = self._sheet(partition_title(year))
+            if ws is None:
+                return normalize_calendar(pd.DataFrame())
+            return normalize_calendar(values_to_frame(self._get_values(ws)))
+
+        indice = self._read_index()
+        hojas = [h for h in indice["hoja"] if self._sheet(h) is not None]
+        return self._calendar_from_partitions(self._batch_values(hojas))
+
+    @_reconnecting(retry=True)
+    def load_all(self):
+        if self._legacy_layout():
+            try:
+                rangos = self._batch_values(["participantes", LEGACY_CALENDAR]
+                                            if LEGACY_CALENDAR in self._sheets
+                                            else ["participantes"])
+                rangos += [[]] * (2 - len(rangos))
+                return (
+                    normalize_participants(values_to_frame(rangos[0])),
+                    normalize_calendar(values_to_frame(rangos[1])),
+                )
+            except APIError:
+                if not self._migrated_meanwhile():
+                    raise
+
+        # Participantes, índice y las particiones conocidas en un solo
+        # values_batch_get. Solo si el índice lista años nuevos (creados por
+        # otro proceso) se hace una segunda lectura para esos.
+        conocidas = self._known_partitions()
+        rangos = self._batch_values(["participantes", CALENDAR_INDEX] + conocidas)
+        participantes = normalize_participants(values_to_frame(rangos[0]))
+        indice = normalize_index(values_to_frame(rangos[1]))
+        por_hoja = dict(zip(conocidas, rangos[2:]))
+
+        faltan = [h for h in indice["hoja"] if h not in por_hoja]
+        if faltan:
+            self._refresh_sheets()
+            faltan = [h for h in faltan if h in self._sheets]
+            por_hoja.update(zip(faltan, self._batch_values(faltan)))
+
+        particiones = [por_hoja[h] for h in indice["hoja"] if h in por_hoja]
+        return participantes, self._calendar_from_partitions(particiones)
+
+    @_reconnecting(retry=True)
+    def max_calendar_id(self):
+        if not self.partitioned:
+            return super().max_calendar_id()
+        indice = self._read_index()
+        return int(indice["max_id"].max()) if len(indice) else 0
+
+    def _read_sequences(self):
+        ws = self._sheet(SEQUENCE_SHEET, header=COLS_SECUENCIAS)
+        return ws, normalize_sequences(values_to_frame(self._get_values(ws)))
+
+    @_reconnecting(retry=False)
+    def allocate_ids(self, sequence, count=1):
+        # Una lectura y una escritura de la hoja "secuencias", pequeña sin
+        # importar el tamaño del grupo. Entre procesos distintos no hay
+        # candado; la ventana de choque es esa lectura y escritura.
+        if sequence not in SEQUENCES:
+            raise ValueError(f"Secuencia desconocida: {sequence}")
+        with _sequence_lock:
+            ws, seqs = self._read_sequences()
+            fila = seqs.index[seqs["secuencia"] == sequence]
+            ultimo = seqs.at[fila[0], "ultimo"] if len(fila) else np.nan
+            if pd.isna(ultimo):
+                ultimo = self.max_id(sequence)
+            fila = fila[0] + 2 if len(fila) else len(seqs) + 2
+            ws.batch_update(
+                [{"range": f"A{fila}", "values": [[sequence, int(ultimo) + count]]}],
+                value_input_option="USER_ENTERED",
+            )
+        return int(ultimo) + 1
+
+    @_reconnecting(retry=False)
+    def rebuild_sequences(self):
+        # Por si se agregaron filas a mano: cada contador queda en el máximo
+        # entre su valor y el id más alto de los datos.
+        with _sequence_lock:
+            ws, seqs = self._read_sequences()
+            guardados = dict(zip(seqs["secuencia"], seqs["ultimo"].fillna(0).astype("int64")))
+            ultimos = {
+                seq: max(int(guardados.get(seq, 0)), self.max_id(seq)) for seq in SEQUENCES
+            }
+            otros = [[k, int(v)] for k, v in guardados.items() if k not in ultimos and k]
+            rows = [COLS_SECUENCIAS] + [[k, v] for k, v in ultimos.items()] + otros
+            ws.batch_update([{"range": "A1", "values": rows}], value_input_option="USER_ENTERED")
+        return ultimos
+
+    def _write_rows(self, ws, df_old, df_new):
+        # df_old es el contenido completo de `ws` y su índice la fila de la
+        # hoja - 2, así que solo se tocan las celdas que cambiaron. Las filas
+        # sin id (escritas a mano, quedan en 0) no se tocan; un id repetido
+        # no se sabe a qué fila corresponde, así que no se escribe nada.
+        df_old = df_old.assign(_fila=df_old.index + 2)
+        df_old = df_old[df_old["id"] > 0]
+        df_new = df_new[df_new["id"] > 0]
+        repetidos = df_old.loc[df_old["id"].duplicated(), "id"]
+        if len(repetidos):
+            raise ValueError(
+                f"La hoja {ws.title} tiene ids repetidos: "
+                f"{', '.join(map(str, sorted(set(repetidos))))}. Corrígelos antes de guardar."
+            )
+
+        d = diff_calendar(df_old, df_new)
+        old, new, changed = d["old"], d["new"], d["changed"]
+
+        # 1) Celdas modificadas en filas existentes, en un solo batch_update.
+        updates = []
+        for col in changed.columns:
+            col_idx = COLS_CALENDARIO.index(col) + 1
+            for row_id in changed.index[changed[col]]:
+                updates.append(
+                    {
+                        "range": rowcol_to_a1(int(old.at[row_id, "_fila"]), col_idx),
+                        "values": [[d["new_vals"].at[row_id, col]]],
+                    }
+                )
+        if updates:
+            ws.batch_update(updates, value_input_option="USER_ENTERED")
+
+        # 2) Filas que ya no existen.
+        filas = list(old.loc[d["borrados"], "_fila"].astype(int))
+        if filas:
+            self._delete_rows(ws, filas)
+
+        # 3) Filas nuevas al final.
+        if len(d["nuevos"]):
+            df_add = new.loc[d["nuevos"]].reset_index()[COLS_CALENDARIO]
+            rows = frame_values(df_add).values.tolist()
+            ws.append_rows(rows, value_input_option="USER_ENTERED")
+
+        return bool(filas) or bool(len(d["nuevos"]))
+
+    def _write_index(self, cambios):
+        # cambios: {anio: max_id de ese año tras escribir}. El índice es
+        # pequeño, así que se reescribe completo en una sola llamada.
+        ws = self._sheet(CALENDAR_INDEX, header=COLS_INDICE)
+        indice = self._read_index().set_index("anio")
+        for anio, max_id in cambios.items():
+            previo = int(indice.at[anio, "max_id"]) if anio in indice.index else 0
+            indice.loc[anio, "hoja"] = partition_title(anio)
+            indice.loc[anio, "max_id"] = max(previo, int(max_id))
+        indice = indice.sort_index().reset_index()[COLS_INDICE]
+        rows = [COLS_INDICE] + frame_values(indice).values.tolist()
+        ws.batch_update([{"range": "A1", "values": rows}], value_input_option="USER_ENTERED")
+
+    @_reconnecting(retry=False)
+    def write_calendar(self, df_old, df_new):
+        # df_old: lo que devolvió load_calendar() (todo o un año). Solo se
+        # escriben las hojas de los años con cambios.
+        legado = not self.partitioned
+        if legado:
+            # El índice de df_old son filas de la hoja única: tras migrar se
+            # vuelve a leer cada año de su hoja nueva.
+            self.migrate_partitions()
+
+        cambios = {}
+        for anio in sorted(set(df_old["anio"]) | set(df_new["anio"])):
+            if legado:
+                old_y = self.load_calendar(int(anio))
+            else:
+                old_y = df_old[df_old["anio"] == anio]
+            new_y = df_new[df_new["anio"] == anio]
+            ws = self._sheet(partition_title(anio), header=COLS_CALENDARIO)
+            if self._write_rows(ws, old_y, new_y):
+                cambios[int(anio)] = int(new_y["id"].max()) if len(new_y) else 0
+        if cambios:
+            self._write_index(cambios)
+
+    @_reconnecting(retry=False)
+    def migrate_partitions(self):
+        # Reparte la hoja única "calendario" en hojas por año. Se puede
+        # repetir si se interrumpe: cada partición se reescribe completa y
+        # el índice (que marca el formato nuevo) se escribe al final.
+        self._refresh_sheets()
+        if self.partitioned:
+            return 0
+        df = self._load_legacy_calendar()
+
+        cambios = {}
+        for anio in sorted(df["anio"].unique()):
+            rows = ensure_columns(df[df["anio"] == anio].copy(), COLS_CALENDARIO)
+            ws = self._sheet(partition_title(anio), header=COLS_CALENDARIO)
+            ws.clear()
+            set_with_dataframe(ws, frame_values(rows))
+            cambios[int(anio)] = int(rows["id"].max())
+        self._write_index(cambios)
+
+        legacy = self._sheets.get(LEGACY_CALENDAR)
+        if legacy is not None:
+            legacy.update_title(f"{LEGACY_CALENDAR}_respaldo")
+        self._refresh_sheets()
+        return len(cambios)
+
+    @_reconnecting(retry=True)
+    def load_payments(self):
+        ws = self._pagos_sheet()
+        if ws is None:
+            return normalize_payments(pd.DataFrame(columns=COLS_PAGOS))
+        # Igual que en el calendario, el índice conserva la fila de la hoja.
+        return normalize_payments(values_to_frame(self._get_values(ws)))
+
+    @_reconnecting(retry=True)
+    def load_summary(self):
+        ws = self._sheet(SUMMARY_SHEET)
+        if ws is None:
+            return normalize_summary(pd.DataFrame())
+        return normalize_summary(values_to_frame(self._get_values(ws)))
+
+    @_reconnecting(retry=False)
+    def write_summary(self, summary):
+        # Una sola escritura sobre el rango. Los años del calendario solo
+        # crecen, así que no quedan filas viejas debajo.
+        ws = self._sheet(SUMMARY_SHEET, header=COLS_RESUMEN)
+        rows = [COLS_RESUMEN] + frame_values(summary[COLS_RESUMEN]).values.tolist()
+        ws.batch_update([{"range": "A1", "values": rows}], value_input_option="USER_ENTERED")
+
+    @_reconnecting(retry=False)
+    def write_payments(self, marcar=(), desmarcar=()):
+        marcar = [(int(c), int(p)) for c, p in marcar]
+        desmarcar = {(int(c), int(p)) for c, p in desmarcar}
+        if not marcar and not desmarcar:
+            return
+
+        ws = self._pagos_sheet(create=bool(marcar))
+        if ws is None:
+            return
+        pagos = self.load_payments()
+        pares = pd.Series(
+            list(zip(pagos["id_calendario"], pagos["id_participante"])),
+            index=pagos.index,
+            dtype=object,
+        )
+
+        quitar = pares[pares.isin(desmarcar)]
+        if len(quitar):
+            self._delete_rows(ws, quitar.index + 2)
+
+        existentes = set(pares) - desmarcar
+        fecha = now_str()
+        rows = [
+            [c, p, fecha] for c, p in dict.fromkeys(marcar) if (c, p) not in existentes
+        ]
+        if rows:
+            ws.append_rows(rows, value_input_option="USER_ENTERED")
+
+# ============================================================
+# SQLITE
+# ============================================================
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS participantes (
+    id INTEGER PRIMARY KEY,
+    nombre TEXT NOT NULL DEFAULT '',
+    fecha_cumple TEXT NOT NULL DEFAULT '',
+    telefono TEXT NOT NULL DEFAULT '',
+    email TEXT NOT NULL DEFAULT '',
+    notas TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS calendario (
+    id INTEGER PRIMARY KEY,
+    anio INTEGER NOT NULL,
+    id_participante INTEGER,
+    nombre_participante TEXT NOT NULL DEFAULT '',
+    fecha_pago TEXT NOT NULL DEFAULT '',
+    monto_por_persona REAL,
+    total_a_recibir REAL,
+    estatus TEXT NOT NULL DEFAULT 'Pendiente',
+    fecha_pago_real TEXT NOT NULL DEFAULT '',
+    notas TEXT NOT NULL DEFAULT '',
+    pagos_detalle TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_calendario_anio ON calendario (anio);
+CREATE INDEX IF NOT EXISTS idx_calendario_participante ON calendario (id_participante);
+CREATE INDEX IF NOT EXISTS idx_calendario_fecha_pago ON calendario (fecha_pago);
+CREATE TABLE IF NOT EXISTS pagos (
+    id_calendario INTEGER NOT NULL,
+    id_participante INTEGER NOT NULL,
+    fecha_registro TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (id_calendario, id_participante)
+);
+CREATE INDEX IF NOT EXISTS idx_pagos_participante ON pagos (id_participante);
+CREATE TABLE IF NOT EXISTS secuencias (
+    secuencia TEXT PRIMARY KEY,
+    ultimo INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS resumen (
+    anio INTEGER PRIMARY KEY,
+    participantes INTEGER,
+    turnos INTEGER,
+    monto_por_persona REAL,
+    total_a_recibir REAL,
+    completados INTEGER,
+    pendientes INTEGER,
+    calculado TEXT NOT NULL DEFAULT '',
+    proximo_id INTEGER,
+    proximo_nombre TEXT NOT NULL DEFAULT '',
+    proximo_nickname TEXT NOT NULL DEFAULT '',
+    proximo_fecha TEXT NOT NULL DEFAULT '',
+    proximo_total REAL,
+    proximo_estatus TEXT NOT NULL DEFAULT '',
+    proximo_futuro INTEGER
+);
+"""
+
+class SQLiteStorage(TandaStorage):
+
+    def __init__(self, path):
+        self.path = path
+        with closing(self._connect()) as conn:
+            conn.executescript(SQLITE_SCHEMA)
+
+    def _connect(self):
+        # Una conexión por operación: Streamlit ejecuta cada sesión en su
+        # propio hilo y sqlite3 no comparte conexiones entre hilos.
+        return sqlite3.connect(self.path, timeout=10)
+
+    def _rows(self, df, columns):
+        df = ensure_columns(df.copy(), columns)
+        return frame_values(df).values.tolist()
+
+    def load_participants(self):
+        with closing(self._connect()) as conn:
+            df = pd.read_sql_query(
+                "SELECT * FROM participantes ORDER BY id", conn
+            )
+        return normalize_participants(df)
+
+    def add_participant(self, nombre, fecha_cumple, telefono, email, notas):
+        new_id = self.allocate_ids("participantes")
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT INTO participantes (id, nombre, fecha_cumple, telefono, email, notas) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (new_id, nombre, fecha_cumple, telefono, email, notas),
+            )
+        return new_id
+
+    def add_participants(self, df):
+        if df.empty:
+            return []
+        primero = self.allocate_ids("participantes", len(df))
+        marcas = ", ".join("?" for _ in COLS_PARTICIPANTES)
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                f"INSERT INTO participantes ({', '.join(COLS_PARTICIPANTES)}) VALUES ({marcas})",
+                self._participant_rows(df, primero),
+            )
+        return list(range(primero, primero + len(df)))
+
+    def load_calendar(self, year=None):
+        query = "SELECT * FROM calendario"
+        params = ()
+        if year is not None:
+            query += " WHERE anio = ?"
+            params = (int(year),)
+        with closing(self._connect()) as conn:
+            df = pd.read_sql_query(query + " ORDER BY anio, fecha_pago, id", conn, params=params)
+        return normalize_calendar(df)
+
+    def write_calendar(self, df_old, df_new):
+        d = diff_calendar(df_old, df_new) if not df_old.empty else None
+        if d is None:
+            upsert = ensure_columns(df_new.copy(), COLS_CALENDARIO)
+            borrados = []
+        else:
+            ids = list(d["changed"].index[d["changed"].any(axis=1)]) + list(d["nuevos"])
+            upsert = d["new"].loc[ids].reset_index()
+            borrados = [int(x) for x in d["borrados"]]
+
+        placeholders = ", ".join("?" for _ in COLS_CALENDARIO)
+        with closing(self._connect()) as conn, conn:
+            if borrados:
+                conn.executemany(
+                    "DELETE FROM calendario WHERE id = ?", [(x,) for x in borrados]
+                )
+            if len(upsert):
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO calendario ({', '.join(COLS_CALENDARIO)}) "
+                    f"VALUES ({placeholders})",
+                    self._rows(upsert, COLS_CALENDARIO),
+                )
+
+    def max_calendar_id(self):
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT COALESCE(MAX(id), 0) FROM calendario").fetchone()
+        return int(row[0])
+
+    def allocate_ids(self, sequence, count=1):
+        # En una sola transacción; el contador nunca queda por debajo del id
+        # más alto de la tabla (MAX(id) sobre la llave primaria es directo).
+        if sequence not in SEQUENCES:
+            raise ValueError(f"Secuencia desconocida: {sequence}")
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO secuencias (secuencia, ultimo) VALUES (?, 0)", (sequence,)
+            )
+            conn.execute(
+                f"UPDATE secuencias SET ultimo = "
+                f"MAX(ultimo, (SELECT COALESCE(MAX(id), 0) FROM {sequence})) + ? "
+                f"WHERE secuencia = ?",
+                (int(count), sequence),
+            )
+            row = conn.execute(
+                "SELECT ultimo FROM secuencias WHERE secuencia = ?", (sequence,)
+            ).fetchone()
+        return int(row[0]) - int(count) + 1
+
+    def load_payments(self):
+        with closing(self._connect()) as conn:
+            df = pd.read_sql_query(
+                "SELECT * FROM pagos ORDER BY id_calendario, id_participante", conn
+            )
+        return normalize_payments(df)
+
+    def write_payments(self, marcar=(), desmarcar=()):
+        marcar = [(int(c), int(p)) for c, p in marcar]
+        desmarcar = [(int(c), int(p)) for c, p in desmarcar]
+        fecha = now_str()
+        with closing(self._connect()) as conn, conn:
+            if desmarcar:
+                conn.executemany(
+                    "DELETE FROM pagos WHERE id_calendario = ? AND id_participante = ?",
+                    desmarcar,
+                )
+            if marcar:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO pagos (id_calendario, id_participante, fecha_registro) "
+                    "VALUES (?, ?, ?)",
+                    [(c, p, fecha) for c, p in marcar],
+                )
+
+    def drop_payments(self, calendar_ids):
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "DELETE FROM pagos WHERE id_calendario = ?",
+                [(int(c),) for c in calendar_ids],
+            )
+
+    def load_summary(self):
+        with closing(self._connect()) as conn:
+            df = pd.read_sql_query("SELECT * FROM resumen ORDER BY anio", conn)
+        return normalize_summary(df)
+
+    def write_summary(self, summary):
+        rows = self._rows(summary, COLS_RESUMEN)
+        marcas = ", ".join("?" * len(COLS_RESUMEN))
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM resumen")
+            conn.executemany(
+                f"INSERT INTO resumen ({', '.join(COLS_RESUMEN)}) VALUES ({marcas})", rows
+            )